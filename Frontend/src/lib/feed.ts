@@ -26,7 +26,7 @@ export async function fetchFeed(startIndex = 0, count = 2): Promise<Video[]> {
   // Fetch a page of videos from DB
   const { data: rows, error } = await supabase
     .from('videos')
-    .select('id, url')
+    .select('id, url, manifest_url')
     .order('id', { ascending: true })
     .range(startIndex, startIndex + count - 1);
 
@@ -41,7 +41,7 @@ export async function fetchFeed(startIndex = 0, count = 2): Promise<Video[]> {
       const meLiked = await getVideoLikeStatus(idStr);
       return {
         id: idStr,
-        src: dbVideo.url,
+        src: dbVideo.manifest_url ?? dbVideo.url, // HLS ladder when ingested with one
         caption: `Video ${dbVideo.id}`,
         author: {
           id: `u_${dbVideo.id}`,
@@ -72,7 +72,7 @@ export async function fetchRecommendedFeed(recommendedVideoIds: number[]): Promi
   // Get video data from Supabase by IDs
   const { data: videoData, error } = await supabase
     .from('videos')
-    .select('id, url')
+    .select('id, url, manifest_url')
     .in('id', recommendedVideoIds);
     
   if (error) {
@@ -95,7 +95,7 @@ export async function fetchRecommendedFeed(recommendedVideoIds: number[]): Promi
       
       return {
         id: videoId,
-        src: dbVideo.url,
+        src: dbVideo.manifest_url ?? dbVideo.url, // HLS ladder when ingested with one
         caption: `Recommended Video ${dbVideo.id}`,
         author: { 
           id: `u_${dbVideo.id}`, 
@@ -0,0 +1,295 @@
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+from typing import Dict
+
+import numpy as np
+
+from metrics import COUNT_BUCKETS, registry, span
+from rounds import DEFAULT_TRUST, LATE_WEIGHT, MIN_UPDATES, ROUND_DEADLINE, RoundScheduler, admissions
+from seen import SeenStore
+from slates import SLATE_USERS, SlateBuilder, slate_key
+from trust_graph_utils import create_trust_graph, trust_graph_to_json, update_trust, add_device_to_trust_graph
+
+EXPECTED_CLIENTS = 2   # how many devices you expect in this round
+NOISY_ID = "noisy"
+DECAY_FACTOR = 0.9
+
+updates_total = registry.counter("fl_updates_total", "Client updates received")
+rounds_total = registry.counter("fl_rounds_total", "Aggregation rounds completed")
+round_clients = registry.histogram("fl_round_clients", "Clients aggregated per round", buckets=COUNT_BUCKETS)
+aggregation_seconds = registry.histogram("fl_aggregation_seconds", "Trust-weighted aggregation time")
+model_version = registry.gauge("fl_model_version", "Published global model version")
+catalog_videos = registry.gauge("catalog_videos", "Videos in the published catalog snapshot")
+
+
+class Aggregator:
+    """
+    Owns the federated round: pending client updates, latest user vectors and
+    the trust graph. Each aggregated model is published to `state` (a
+    shared_state.SharedState) so every serving worker picks it up, and saved
+    to `checkpoints` (a checkpoints.CheckpointStore) so a restart resumes it.
+    With build_slates, every publication also rebuilds precomputed slates
+    for the most recently active user vectors (slates.SlateBuilder).
+
+    Rounds are run by a rounds.RoundScheduler: devices check in for an
+    assignment, only the round's cohort (plus last round's stragglers, at a
+    discount) is admitted, and a round is aggregated once `expected_clients`
+    updates are in or at its deadline, whichever comes first. Each client
+    is kept as a running sum, so a round costs one model per client however
+    often it submits.
+
+    Lives in exactly one process; with several uvicorn workers it is served
+    over a multiprocessing manager (see serve.py) and the workers call it
+    through a proxy. Methods are serialized with a lock.
+    """
+
+    def __init__(self, state, initial_weights, expected_clients=EXPECTED_CLIENTS, checkpoints=None,
+                 build_slates=False, deadline=ROUND_DEADLINE):
+        self.state = state
+        self.checkpoints = checkpoints
+        self.expected_clients = expected_clients
+        self.lock = threading.Lock()
+        self.client_updates: Dict[str, list] = {}  # client -> [per-layer sums, count] this round
+        self.carried: Dict[str, tuple] = {}  # late updates from last round's cohort -> (weight, layers)
+        self.scheduler = RoundScheduler(expected_clients, deadline=deadline)
+        self.client_vectors: Dict[str, np.ndarray] = {}
+        self.seen = SeenStore()  # per-user watched videos, has its own lock
+        self.requesters = OrderedDict()  # slate key -> user vector of recent /recommend misses
+        self.slate_builder = SlateBuilder(state, self.slate_users) if build_slates else None
+        self.trust_graph = create_trust_graph(expected_clients)
+        self.trust_graph.add_node(NOISY_ID, trust=0.2)
+        self.version = state.publish_model(initial_weights)
+        model_version.set(self.version)
+        self._rebuild_slates()
+        threading.Thread(target=self._deadline_loop, daemon=True).start()
+
+    # -----------------------------
+    # Rounds
+    # -----------------------------
+    def check_in(self, client_id):
+        """Round assignment for a device: {"round", "selected", "deadline"[, "retry_after"]}."""
+        with self.lock:
+            return self.scheduler.check_in(client_id, time.monotonic())
+
+    def admit(self, client_id, round_id=None):
+        """
+        Read-only pre-check before a worker decodes an update: None if it
+        would be accepted, else the rejection. Nothing is enrolled until submit().
+        """
+        with self.lock:
+            result = self.scheduler.would_admit(client_id, round_id)
+        if result in ("current", "late"):
+            return None
+        admissions.inc(result="rejected")
+        return {"status": "Rejected", "reason": result, "round": self.scheduler.round}
+
+    def submit(self, client_id, weights, round_id=None):
+        """Record one client's weights; aggregates and publishes once the round reaches its quorum."""
+        client_weights = [np.asarray(w, np.float32) for w in weights]
+        updates_total.inc()
+        with self.lock:
+            result = self.scheduler.admit(client_id, round_id, time.monotonic())
+            admissions.inc(result=result if result in ("current", "late") else "rejected")
+            if result == "late":
+                return self._carry(client_id, client_weights)
+            if result != "current":
+                return {"status": "Rejected", "reason": result, "round": self.scheduler.round}
+            self.scheduler.report(client_id, time.monotonic())
+            return self._submit(client_id, client_weights)
+
+    def _carry(self, client_id, client_weights):
+        """A straggler of the previous round: folded into this round's average at LATE_WEIGHT."""
+        self.scheduler.report(client_id, time.monotonic(), late=True)
+        self.client_vectors[client_id] = np.array(client_weights[0][0, :16], dtype=np.float32)
+        trust = self.trust_graph.nodes[client_id]["trust"] if client_id in self.trust_graph else DEFAULT_TRUST
+        self.carried[client_id] = (LATE_WEIGHT * trust, client_weights)
+        return {"status": "Carried forward", "round": self.scheduler.round}
+
+    def _deadline_loop(self):
+        tick = min(1.0, self.scheduler.deadline / 10)
+        while True:
+            time.sleep(tick)
+            with self.lock:
+                if self.scheduler.expired(time.monotonic()):
+                    self._close_round("deadline")
+
+    def _submit(self, client_id, client_weights):
+        # Extract the first 16 elements as the user vector
+        user_vector = np.array(client_weights[0][0, :16], dtype=np.float32)
+        self.client_vectors[client_id] = user_vector
+        print("client", client_id, ": ", user_vector)
+
+        # Simulate a local validation accuracy for demo
+        val_acc = random.uniform(0.7, 0.95) if "noisy" not in client_id else 0.2
+
+        # --- Add or update client node dynamically ---
+        if client_id not in self.client_updates:
+            add_device_to_trust_graph(self.trust_graph, client_id, initial_trust=val_acc)
+
+        # Update trust for this client
+        update_trust(self.trust_graph, client_id, val_acc)
+
+        self.scheduler.set_trust(client_id, self.trust_graph.nodes[client_id]["trust"])
+
+        # Add weights to this client's running sum
+        self._accumulate(client_id, client_weights)
+
+        # --- Simulate noisy node contributes once per round ---
+        if NOISY_ID not in self.client_updates:
+            # Generate noisy update (randomized)
+            noisy_weights = [w + np.random.normal(0, 0.5, w.shape) for w in client_weights]
+            self._accumulate(NOISY_ID, noisy_weights)
+            # Trust remains low
+            current_trust = self.trust_graph.nodes[NOISY_ID].get("trust", 0.2)
+            new_trust = max(0.0, current_trust * DECAY_FACTOR)  # avoid going below 0
+            update_trust(self.trust_graph, NOISY_ID, new_trust)
+
+        if len(self.client_updates) < self.expected_clients:
+            return {"status": f"Waiting for {self.expected_clients - len(self.client_updates)} more clients",
+                    "round": self.scheduler.round}
+        return self._close_round("quorum")
+
+    def _accumulate(self, client_id, client_weights):
+        entry = self.client_updates.get(client_id)
+        if entry is None:
+            self.client_updates[client_id] = [[np.array(w, np.float32) for w in client_weights], 1]
+        else:
+            for total, w in zip(entry[0], client_weights):
+                total += w
+            entry[1] += 1
+
+    def _close_round(self, reason):
+        """Aggregate and publish this round's updates (if there are enough), then open the next round."""
+        now = time.monotonic()
+        round_id = self.scheduler.round
+        real = len(self.client_updates) - (NOISY_ID in self.client_updates)
+        had_cohort = bool(self.scheduler.cohort)
+        self.scheduler.close(now, reason if real >= MIN_UPDATES else "abandoned")
+        if real < MIN_UPDATES:
+            self.client_updates, self.carried = {}, {}
+            if had_cohort:
+                self.scheduler.open(now)  # else the next check-in opens it
+            return {"status": "Abandoned", "round": round_id}
+
+        start = time.perf_counter()
+        new_weights = self._aggregate()
+        aggregation_seconds.observe(time.perf_counter() - start)
+        round_clients.observe(len(self.client_updates))
+        with span("aggregator.publish_model"):
+            self.version = self.state.publish_model(new_weights)
+        if self.checkpoints is not None:
+            self.checkpoints.save(new_weights)
+        self._rebuild_slates()
+        rounds_total.inc()
+        model_version.set(self.version)
+        # Reset for next round
+        self.client_updates, self.carried = {}, {}
+        self.scheduler.open(now)
+        return {"status": "Aggregated", "new_global_model": "ready", "version": self.version, "round": round_id}
+
+    def _aggregate(self):
+        """Federated averaging with trust weighting; carried-over late updates count at LATE_WEIGHT."""
+        # Average multiple submissions per client
+        contributions = [
+            (self.trust_graph.nodes[c]['trust'], [total / count for total in sums])
+            for c, (sums, count) in self.client_updates.items()
+        ]
+        contributions += self.carried.values()
+
+        # Weighted aggregation using trust scores
+        new_weights = []
+        total_trust = sum(trust for trust, _ in contributions)
+        for layer_idx in range(len(contributions[0][1])):
+            weighted_sum = sum(trust * weights[layer_idx] for trust, weights in contributions)
+            new_weights.append(weighted_sum / total_trust)
+        return new_weights
+
+    def user_vectors(self):
+        with self.lock:
+            return {user_id: vec.tolist() for user_id, vec in self.client_vectors.items()}
+
+    def mark_seen(self, events):
+        """Bulk watch events [(user_id, video_id), ...]; returns how many users were touched."""
+        return self.seen.add_events(events)
+
+    def seen_filter(self, user_id):
+        return self.seen.filter(user_id)
+
+    def trust_graph_json(self):
+        with self.lock:
+            return trust_graph_to_json(self.trust_graph)
+
+    def refresh_catalog(self, rows):
+        """Publish a catalog snapshot from videos-table rows (id, gen_vector, url)."""
+        rows = [r for r in rows if len(r.get("gen_vector") or []) == 16]
+        with span("aggregator.publish_catalog"):
+            version = self.state.publish_catalog(
+                [r["id"] for r in rows],
+                np.array([r["gen_vector"] for r in rows], np.float32).reshape(len(rows), 16),
+                [r["url"] for r in rows])
+        catalog_videos.set(len(rows))
+        self._rebuild_slates()
+        return version
+
+    # -----------------------------
+    # Slates
+    # -----------------------------
+    def _rebuild_slates(self):
+        if self.slate_builder is not None:
+            self.slate_builder.trigger()
+
+    def note_requester(self, user_vec):
+        """A /recommend without a fresh slate: include this vector in the next build."""
+        key = slate_key(user_vec)
+        with self.lock:
+            new = key not in self.requesters
+            self.requesters[key] = np.asarray(user_vec, np.float32)
+            self.requesters.move_to_end(key)
+            while len(self.requesters) > SLATE_USERS:
+                self.requesters.popitem(last=False)
+        if new:
+            self._rebuild_slates()
+
+    def slate_users(self):
+        """Distinct vectors to build slates for: recent requesters (newest first), then training clients."""
+        with self.lock:
+            vectors = {}
+            for key, vec in reversed(self.requesters.items()):
+                vectors[key] = vec
+            for vec in self.client_vectors.values():
+                vectors.setdefault(slate_key(vec), vec)
+            return list(vectors.values())[:SLATE_USERS]
+
+
+# -----------------------------
+# Cross-process access
+# -----------------------------
+class AggregatorManager(BaseManager):
+    pass
+
+
+def serve_aggregator(aggregator, address, authkey):
+    """Serve `aggregator` to worker processes; blocks, so run it on a daemon thread."""
+    AggregatorManager.register("aggregator", callable=lambda: aggregator)
+    manager = AggregatorManager(address=address, authkey=authkey)
+    manager.get_server().serve_forever()
+
+
+def connect_aggregator(address, authkey):
+    """Proxy to the aggregator served by serve_aggregator (every method call is one round-trip)."""
+    AggregatorManager.register("aggregator")
+    manager = AggregatorManager(address=address, authkey=authkey)
+    manager.connect()
+    return manager.aggregator()
+
+
+def aggregator_address():
+    """(address, authkey) from the environment when running under serve.py, else None."""
+    address = os.environ.get("FL_AGGREGATOR")
+    if not address:
+        return None
+    return address, bytes.fromhex(os.environ["FL_AGGREGATOR_KEY"])
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from metrics import registry, span
+
+CHECKPOINT_DIR = os.environ.get("FL_CHECKPOINT_DIR", "checkpoints")
+KEEP_CHECKPOINTS = 5
+SYNC_BACKOFF = 1         # seconds, doubled per failed push
+MAX_SYNC_BACKOFF = 300
+SYNCED = "synced.json"   # last version the remote has
+
+checkpoint_version = registry.gauge("checkpoint_version", "Newest local model checkpoint")
+sync_failures = registry.counter("checkpoint_sync_failures_total", "Failed pushes of a checkpoint to the remote table")
+
+
+class CheckpointStore:
+    """
+    Aggregated global models as versioned files on local disk.
+
+    A version is model-{v}.f32 (the weights back to back, float32) plus
+    model-{v}.json with their shapes. The json is renamed into place last,
+    so a version only exists once both files are complete, and load() maps
+    the newest one instead of parsing JSON weight lists. Only the newest
+    `keep` versions are kept.
+
+    With `remote` (a callable taking the weight list, e.g. an insert into
+    the global_models table), every save is also pushed on a background
+    thread. Pushes coalesce to the newest version and retry with backoff;
+    resume_sync() pushes a version the previous run saved but never pushed.
+    """
+
+    def __init__(self, root=CHECKPOINT_DIR, keep=KEEP_CHECKPOINTS, remote=None):
+        self.root = root
+        self.keep = keep
+        self.remote = remote
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.pending = None
+        self.last_queued = 0
+        self.wake = threading.Condition()
+        self.syncer = None
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def versions(self):
+        out = []
+        for name in os.listdir(self.root):
+            if name.startswith("model-") and name.endswith(".json"):
+                try:
+                    out.append(int(name[len("model-"):-len(".json")]))
+                except ValueError:
+                    continue
+        return sorted(out)
+
+    def newest(self):
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def load(self, version=None):
+        """(version, [memory-mapped weight arrays]) of `version` or the newest, or (None, None)."""
+        version = version or self.newest()
+        if version is None:
+            return None, None
+        with open(self._path(f"model-{version}.json")) as f:
+            shapes = json.load(f)["shapes"]
+        flat = np.memmap(self._path(f"model-{version}.f32"), dtype=np.float32, mode="r")
+        weights, offset = [], 0
+        for shape in shapes:
+            size = int(np.prod(shape))
+            weights.append(flat[offset:offset + size].reshape(shape))
+            offset += size
+        return version, weights
+
+    def save(self, weights, sync=True):
+        """Write weights as the next version (and queue the remote push). Returns the version."""
+        weights = [np.asarray(w, np.float32) for w in weights]
+        with self.lock, span("checkpoint.save"):
+            version = (self.newest() or 0) + 1
+            tmp = self._path(f"model-{version}.f32.tmp")
+            with open(tmp, "wb") as f:
+                for w in weights:
+                    np.ascontiguousarray(w).tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._path(f"model-{version}.f32"))
+            tmp = self._path(f"model-{version}.json.tmp")
+            with open(tmp, "w") as f:
+                json.dump({"shapes": [list(w.shape) for w in weights], "saved_at": time.time()}, f)
+            os.replace(tmp, self._path(f"model-{version}.json"))
+            self._prune(version)
+        checkpoint_version.set(version)
+        if self.remote is not None:
+            if sync:
+                self._queue(version)
+            else:
+                self._mark_synced(version)  # came from the remote in the first place
+        return version
+
+    def _prune(self, version):
+        for old in self.versions():
+            if old <= version - self.keep:
+                for name in (f"model-{old}.json", f"model-{old}.f32"):
+                    try:
+                        os.remove(self._path(name))
+                    except FileNotFoundError:
+                        continue
+
+    # -----------------------------
+    # Remote sync
+    # -----------------------------
+    def synced_version(self):
+        try:
+            with open(self._path(SYNCED)) as f:
+                return json.load(f)["version"]
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def _mark_synced(self, version):
+        tmp = self._path(SYNCED + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"version": version}, f)
+        os.replace(tmp, self._path(SYNCED))
+
+    def resume_sync(self):
+        newest = self.newest()
+        if self.remote is not None and newest and newest > max(self.synced_version(), self.last_queued):
+            self._queue(newest)
+
+    def _queue(self, version):
+        with self.wake:
+            if self.syncer is None:
+                self.syncer = threading.Thread(target=self._sync_loop, daemon=True)
+                self.syncer.start()
+            self.pending = self.last_queued = version
+            self.wake.notify()
+
+    def _sync_loop(self):
+        backoff = SYNC_BACKOFF
+        while True:
+            with self.wake:
+                while self.pending is None:
+                    self.wake.wait()
+                version, self.pending = self.pending, None
+            if version not in self.versions():
+                continue  # pruned; a newer version is already queued
+            try:
+                _, weights = self.load(version)
+                with span("checkpoint.sync"):
+                    self.remote(weights)
+                self._mark_synced(version)
+                backoff = SYNC_BACKOFF
+            except Exception as e:
+                sync_failures.inc()
+                print(f"⚠️ Checkpoint v{version} sync failed ({e}), retrying in {backoff}s")
+                time.sleep(backoff)
+                backoff = min(MAX_SYNC_BACKOFF, backoff * 2)
+                with self.wake:
+                    if self.pending is None:
+                        self.pending = self.newest()
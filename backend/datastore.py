@@ -0,0 +1,198 @@
+"""
+Data access: the hosted Supabase client, or a local SQLite stand-in.
+
+    DATA_BACKEND=supabase   (default) config.SUPABASE_URL / SUPABASE_KEY
+    DATA_BACKEND=local      SQLite file at DATA_PATH (default local_data.sqlite)
+
+LocalClient answers the subset of the supabase-py API the backend uses
+(table().select/insert/upsert with order, range and limit; storage.from_()),
+so call sites are the same for both. Every uvicorn worker opens the same
+file, so serve.py works unchanged against it.
+
+    python datastore.py seed --videos 100000    # synthetic catalog for load tests
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+DATA_BACKEND = os.environ.get("DATA_BACKEND", "supabase")
+DATA_PATH = os.environ.get("DATA_PATH", "local_data.sqlite")
+STORAGE_ROOT = os.environ.get("DATA_STORAGE", "local_storage")
+SEED_BATCH = 5000
+
+
+def connect():
+    """Client for DATA_BACKEND; the Supabase import and config are only needed for the hosted backend."""
+    if DATA_BACKEND == "local":
+        return LocalClient(DATA_PATH)
+    import config
+    from supabase import create_client
+    return create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+
+
+# -----------------------------
+# Local stand-in
+# -----------------------------
+class LocalClient:
+    """
+    Tables as rows of JSON in one SQLite file (":memory:" for a single
+    process). `id` and `created_at` are real columns so ordering and paging
+    by them stay in SQL; other order columns go through json_extract.
+    """
+
+    def __init__(self, path=DATA_PATH, storage_root=STORAGE_ROOT):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.tables = set()
+        self.storage = SimpleNamespace(from_=lambda bucket: LocalBucket(os.path.join(storage_root, bucket)))
+
+    def table(self, name):
+        return LocalQuery(self, name)
+
+    def _ensure(self, name):
+        if name not in self.tables:
+            # `id` has no declared type so integer and text ids keep their own ordering
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" '
+                              "(row INTEGER PRIMARY KEY AUTOINCREMENT, id UNIQUE, created_at TEXT, data TEXT)")
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}_created" ON "{name}" (created_at)')
+            self.tables.add(name)
+
+    def _insert(self, name, rows, on_conflict=None):
+        if on_conflict not in (None, "id"):
+            raise ValueError(f"LocalClient only upserts on id, not {on_conflict}")
+        with self.lock, self.conn:
+            self._ensure(name)
+            out = []
+            for row in rows:
+                row = dict(row)
+                existing = None
+                if on_conflict and "id" in row:
+                    existing = self.conn.execute(f'SELECT data FROM "{name}" WHERE id = ?', (row["id"],)).fetchone()
+                if existing:
+                    # like PostgREST merge-duplicates: given columns replace, the rest stay
+                    row = {**json.loads(existing[0]), **row}
+                    self.conn.execute(f'UPDATE "{name}" SET data = ? WHERE id = ?', (json.dumps(row), row["id"]))
+                else:
+                    row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+                    cursor = self.conn.execute(f'INSERT INTO "{name}" (id, created_at) VALUES (?, ?)',
+                                               (row.get("id"), row["created_at"]))
+                    row.setdefault("id", cursor.lastrowid)
+                    self.conn.execute(f'UPDATE "{name}" SET id = ?, data = ? WHERE row = ?',
+                                      (row["id"], json.dumps(row), cursor.lastrowid))
+                out.append(row)
+            return out
+
+    def _select(self, name, columns, order, limit, offset):
+        sql = f'SELECT data FROM "{name}"'
+        if order:
+            column, desc = order
+            key = column if column in ("id", "created_at") else f"json_extract(data, '$.{column}')"
+            direction = "DESC" if desc else "ASC"
+            sql += f" ORDER BY {key} {direction}, row {direction}"
+        sql += f" LIMIT {-1 if limit is None else int(limit)} OFFSET {int(offset)}"
+        with self.lock:
+            self._ensure(name)
+            rows = [json.loads(data) for (data,) in self.conn.execute(sql)]
+        if columns != ["*"]:
+            rows = [{c: r.get(c) for c in columns} for r in rows]
+        return rows
+
+
+class LocalQuery:
+    """Chainable query mirroring postgrest's builder; execute() returns an object with .data."""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.columns = ["*"]
+        self.order_by = None
+        self.limit_n = None
+        self.offset = 0
+        self.write = None
+
+    def select(self, columns="*"):
+        self.columns = [c.strip() for c in columns.split(",")]
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    def range(self, start, end):
+        self.offset, self.limit_n = start, end - start + 1
+        return self
+
+    def insert(self, rows):
+        self.write = (rows if isinstance(rows, list) else [rows], None)
+        return self
+
+    def upsert(self, rows, on_conflict="id"):
+        self.write = (rows if isinstance(rows, list) else [rows], on_conflict)
+        return self
+
+    def execute(self):
+        if self.write:
+            return SimpleNamespace(data=self.client._insert(self.name, *self.write))
+        return SimpleNamespace(data=self.client._select(self.name, self.columns, self.order_by,
+                                                        self.limit_n, self.offset))
+
+
+class LocalBucket:
+    """Storage bucket as a directory; public URLs are file:// paths."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def upload(self, name, file, options=None):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(file.read() if hasattr(file, "read") else file)
+        return SimpleNamespace(path=name)
+
+    def get_public_url(self, name):
+        return f"file://{os.path.abspath(os.path.join(self.root, name))}"
+
+
+# -----------------------------
+# Synthetic catalog
+# -----------------------------
+def seed_videos(client, num_videos, seed=42, batch=SEED_BATCH):
+    """Insert num_videos rows of random 16-d gen_vectors (animal half / scenery half)."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, num_videos, batch):
+        n = min(batch, num_videos - start)
+        vectors = rng.random((n, 16), dtype=np.float32)
+        client.table("videos").insert([
+            {"gen_vector": v.round(6).tolist(), "url": f"https://example.com/videos/{start + i}.mp4",
+             "is_animal": bool(v[:8].sum() > v[8:].sum())}
+            for i, v in enumerate(vectors)
+        ]).execute()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    seed = sub.add_parser("seed", help="add synthetic videos to the local store")
+    seed.add_argument("--videos", type=int, default=10000)
+    seed.add_argument("--path", default=DATA_PATH)
+    seed.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        client = LocalClient(args.path)
+        seed_videos(client, args.videos, seed=args.seed)
+        print(f"✅ Seeded {args.videos} videos into {args.path}")
@@ -1,8 +1,9 @@
 from fastapi import APIRouter
 from typing import List
+import os
 import numpy as np
 from pydantic import BaseModel
-from model import BinaryMLP
+from metrics import registry, span
 import requests
 
 router = APIRouter(prefix="/local")
@@ -12,8 +13,12 @@ CLIP_NORM = 1.5           # maximum L2 norm for weight clipping
 NOISE_STD = 0.1           # standard deviation of Gaussian noise
 MAX_SUBSET_RATIO = 0.9    # fraction of weights to keep (rest zeroed out)
 
-GLOBAL_MODEL_URL = "http://localhost:8000/update_model"  # central server endpoint
-GLOBAL_GET_MODEL_URL = "http://localhost:8000/get_global_model"  # get global model endpoint
+SERVER_URL = os.environ.get("FL_SERVER_URL", "http://localhost:8000")
+GLOBAL_MODEL_URL = f"{SERVER_URL}/update_model"  # central server endpoint
+GLOBAL_GET_MODEL_URL = f"{SERVER_URL}/get_global_model"  # get global model endpoint
+ROUND_URL = f"{SERVER_URL}/round"  # round check-in endpoint
+
+train_examples = registry.counter("local_train_examples_total", "Examples trained on by /local/train")
 
 class ModelData(BaseModel):
     client_id: str
@@ -30,13 +35,30 @@ def train_local(data: ModelData):
             "error": f"Input dimension mismatch: expected {expected_input_dim}, got {actual_input_dim}"
         }
     
-    # Initialize local model
-    model = BinaryMLP(input_dim=32, hidden_dim=128)
+    # Check in for the current round; devices outside its cohort skip training
+    try:
+        with span("local.check_in"):
+            assignment = requests.get(ROUND_URL, params={"client_id": data.client_id}).json()
+    except Exception as e:
+        print(f"⚠️ Could not check in: {e}")
+        assignment = {"round": None, "selected": True}
+    if not assignment.get("selected", True):
+        return {
+            "message": f"Client {data.client_id} not selected for round {assignment['round']}",
+            "weights_sent": False,
+            "retry_after": assignment.get("retry_after"),
+        }
+
+    # Initialize local model (TensorFlow is only imported once training is needed)
+    with span("local.build_model"):
+        from model import BinaryMLP
+        model = BinaryMLP(input_dim=32, hidden_dim=128)
 
     # Fetch global model weights
     try:
-        resp = requests.get(GLOBAL_GET_MODEL_URL)
-        global_weights = resp.json().get("weights", [])
+        with span("local.fetch_global_model"):
+            resp = requests.get(GLOBAL_GET_MODEL_URL)
+            global_weights = resp.json().get("weights", [])
         if global_weights:
             model.model.set_weights([np.array(w) for w in global_weights])
         else:
@@ -48,33 +70,38 @@ def train_local(data: ModelData):
     y = np.array(data.y, dtype=np.int32)
 
     # Train locally with differential privacy
-    model.fit_with_dp(X, y, epochs=3, batch_size=16)
+    with span("local.fit_with_dp"):
+        model.fit_with_dp(X, y, epochs=3, batch_size=16)
+    train_examples.inc(len(X))
 
     # Apply Privacy to Weights
     updated_weights = model.model.get_weights()
     private_weights = []
 
-    for w in updated_weights:
-        # 1. Clip the weight vector
-        norm = np.linalg.norm(w)
-        clipped_w = w * min(1.0, CLIP_NORM / (norm + 1e-6))
+    with span("local.privatize"):
+        for w in updated_weights:
+            # 1. Clip the weight vector
+            norm = np.linalg.norm(w)
+            clipped_w = w * min(1.0, CLIP_NORM / (norm + 1e-6))
 
-        # 2. Add Gaussian noise
-        noisy_w = clipped_w + np.random.normal(0, NOISE_STD, size=clipped_w.shape)
+            # 2. Add Gaussian noise
+            noisy_w = clipped_w + np.random.normal(0, NOISE_STD, size=clipped_w.shape)
 
-        # 3. Random subset: zero out a portion of weights
-        mask = np.random.rand(*noisy_w.shape) < MAX_SUBSET_RATIO
-        noisy_w = noisy_w * mask
+            # 3. Random subset: zero out a portion of weights
+            mask = np.random.rand(*noisy_w.shape) < MAX_SUBSET_RATIO
+            noisy_w = noisy_w * mask
 
-        private_weights.append(noisy_w.tolist())
+            private_weights.append(noisy_w.tolist())
 
     # Send to Global Server
     payload = {
         "client_id": data.client_id,
-        "weights": private_weights
+        "weights": private_weights,
+        "round": assignment.get("round"),
     }
     try:
-        resp = requests.post(GLOBAL_MODEL_URL, json=payload)
+        with span("local.send_update"):
+            resp = requests.post(GLOBAL_MODEL_URL, json=payload)
         agg_response = resp.json()
         print(f"Response from global model update: {agg_response}")
     except Exception as e:
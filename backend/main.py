@@ -1,41 +1,66 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-import tensorflow as tf
-from trust_graph_utils import create_trust_graph, trust_graph_to_json, update_trust, add_device_to_trust_graph
-from model import BinaryMLP
-from supabase import create_client, Client
-import config
+from typing import List, Optional
+import datastore
+import json
+import os
 import numpy as np
 from local_api import router as local_router
-from typing import Dict, List
+from aggregator import Aggregator, aggregator_address, connect_aggregator
+from checkpoints import CheckpointStore
+from metrics import MetricsMiddleware, registry, span
+from scoring import ShardedScorer, fold_dequantization, init_weights
+from seen import SeenMasker, seen_ids
+from slates import slate_key
+from shared_state import SharedState
 import random
+import threading
+import time
 
-# Supabase client
-supabase_client: Client = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+# Supabase client (or the local SQLite stand-in with DATA_BACKEND=local)
+supabase_client = datastore.connect()
 
 
-# Global model init
-global_model = BinaryMLP(input_dim=32, hidden_dim= 128)
-expected_clients = 2   # how many devices you expect in this round
-trust_graph = create_trust_graph(expected_clients)
-noisy_id = "noisy"
-trust_graph.add_node(noisy_id, trust=0.2)
+# Global model shape
+INPUT_DIM = 32
+HIDDEN_DIM = 128
+CATALOG_PAGE = 1000
+CATALOG_REFRESH_SECONDS = 300
+# precomputed slates for recently active users, rebuilt on every model/catalog publication
+BUILD_SLATES = os.environ.get("SLATES", "1") != "0"
 
 # -----------------------------
-# Global model in memory
+# Shared state
 # -----------------------------
-global_model_state = None  # list of numpy arrays
-client_updates: Dict[str, List[np.ndarray]] = {}  # store weights per client
-client_vectors: Dict[str, np.ndarray] = {}
+# Published weights and the catalog matrix are memory-mapped from `state` by
+# every worker; round state (client updates, user vectors, trust graph) is
+# owned by `aggregator`, in this process or behind a proxy (serve.py).
+state = SharedState()
+aggregator = None
+# SCORING_THREADS > 1 splits large catalogs into shards scored in parallel
+scorer = ShardedScorer()
+# per-user seen filters (kept by the aggregator) -> masks over this worker's catalog rows
+seen_masker = SeenMasker()
+slate_requests = registry.counter("slate_requests_total", "/recommend served from a slate or scored live", ["result"])
 
 # Pydantic schemas
 class ModelUpdate(BaseModel):
     client_id: str
     weights: list  # list of lists (numpy arrays) 
+    round: Optional[int] = None  # from GET /round; None joins the current round if it has room
 
 class RecommendRequest(BaseModel):
     user_vector: list
     top_k: int = 10
+    user_id: Optional[str] = None  # when set, videos this user has watched are skipped
+
+class WatchEvent(BaseModel):
+    user_id: str
+    video_ids: List[int]
+
+class WatchEvents(BaseModel):
+    events: List[WatchEvent]
 
 # Helper functions
 def save_global_model(weights):
@@ -53,145 +78,159 @@ def load_latest_global_model():
         return [np.array(w) for w in res.data[0]["weights"]]
     return None
 
+# Every aggregated model is checkpointed locally and pushed to global_models in the
+# background; only the process that owns the aggregator writes here
+checkpoints = CheckpointStore(remote=save_global_model)
+
+def initial_global_weights():
+    """Newest local checkpoint (memory-mapped), else the latest Supabase row, else fresh weights."""
+    version, weights = checkpoints.load()
+    if weights is not None:
+        print(f"✅ Loaded global model checkpoint v{version}")
+        return weights
+    weights = load_latest_global_model()
+    if weights:
+        print("✅ Loaded latest global model from Supabase")
+        checkpoints.save(weights, sync=False)
+        return weights
+    # save initial weights
+    initial_weights = init_weights(INPUT_DIM, HIDDEN_DIM)
+    checkpoints.save(initial_weights)
+    print("⚡ Initialized first global model")
+    return initial_weights
+
+def fetch_catalog_rows():
+    """All videos rows with their gen_vector, paged (PostgREST caps one select at 1000 rows)."""
+    rows, start = [], 0
+    while True:
+        with span("catalog.fetch_page"):
+            page = supabase_client.table("videos").select("id, gen_vector, url") \
+                .order("id").range(start, start + CATALOG_PAGE - 1).execute().data
+        for row in page:
+            # pgvector columns come back as "[...]" strings
+            if isinstance(row.get("gen_vector"), str):
+                row["gen_vector"] = json.loads(row["gen_vector"])
+        rows.extend(page)
+        if len(page) < CATALOG_PAGE:
+            return rows
+        start += CATALOG_PAGE
+
+def start_catalog_refresh(aggregator, interval=CATALOG_REFRESH_SECONDS, first_delay=None):
+    """Republish the catalog snapshot every `interval` seconds on a daemon thread."""
+    def loop():
+        time.sleep(interval if first_delay is None else first_delay)
+        while True:
+            try:
+                aggregator.refresh_catalog(fetch_catalog_rows())
+            except Exception as e:
+                print(f"⚠️ Catalog refresh failed: {e}")
+            time.sleep(interval)
+    threading.Thread(target=loop, daemon=True).start()
+
+def create_aggregator():
+    """
+    Aggregator resuming from the newest checkpoint, with a catalog to serve.
+    A snapshot left in shared memory by the previous run is served as-is
+    while a fresh one is fetched behind it; otherwise startup waits for it.
+    """
+    aggregator = Aggregator(state, initial_global_weights(), checkpoints=checkpoints, build_slates=BUILD_SLATES)
+    checkpoints.resume_sync()
+    if state.catalog() is None:
+        aggregator.refresh_catalog(fetch_catalog_rows())
+        start_catalog_refresh(aggregator)
+    else:
+        start_catalog_refresh(aggregator, first_delay=0)
+    return aggregator
+
+def warm_up():
+    """Map the published arrays and score the catalog once, so the first request doesn't pay for it."""
+    _, weights = state.model()
+    catalog = state.catalog()
+    if weights is None or catalog is None or len(catalog) == 0:
+        return
+    with span("startup.warm_up"):
+        weights = fold_dequantization(weights, catalog.scale, catalog.offset)
+        scorer.top_k(weights, np.full(16, 0.5, np.float32), catalog.vectors, 10)
+        catalog.item(0)
+
 # FastAPI App
 app = FastAPI()
 app.include_router(local_router)
+app.add_middleware(MetricsMiddleware)
 
 @app.on_event("startup")
 def startup_event():
-    global global_model, global_model_state
-    weights = load_latest_global_model()
-    if weights:
-        global_model.set_weights(weights)
-        global_model_state = weights
-        print("✅ Loaded latest global model from Supabase")
+    global aggregator
+    address = aggregator_address()
+    if address:
+        # several workers: the serve.py process owns the round and publishes state
+        aggregator = connect_aggregator(*address)
+        # each process exports its metrics so any worker can serve /metrics for all
+        registry.start_export(os.path.join(state.root, "metrics"))
     else:
-        # save initial weights
-        initial_weights = global_model.get_weights()
-        save_global_model(initial_weights)
-        global_model_state = initial_weights
-        print("⚡ Initialized first global model")
+        aggregator = create_aggregator()
+    warm_up()
 
 @app.get("/get_global_model")
 def get_global_model():
-    if global_model_state is None:
+    _, weights = state.model()
+    if weights is None:
         return {"weights": []}
-    return {"weights": [w.tolist() for w in global_model_state]}
+    return {"weights": [w.tolist() for w in weights]}
+
+@app.get("/round")
+def get_round(client_id: str):
+    """Device check-in: the current round and whether this device is in its cohort."""
+    return aggregator.check_in(client_id)
 
 @app.post("/update_model")
 def update_model(update: ModelUpdate):
-    global client_updates, global_model_state, client_vectors, trust_graph, noisy_id
-
-    client_weights = [np.array(w) for w in update.weights]
-
-    # Extract the first 16 elements as the user vector
-    user_vector = np.array(client_weights[0][0, :16], dtype=np.float32)
-    client_vectors[update.client_id] = user_vector
-    print("client", update.client_id, ": ", user_vector)
-
-    # Simulate a local validation accuracy for demo
-    val_acc = random.uniform(0.7, 0.95) if "noisy" not in update.client_id else 0.2
-
-    # --- Add or update client node dynamically ---
-    if update.client_id not in client_updates:
-        client_updates[update.client_id] = []
-        add_device_to_trust_graph(trust_graph, update.client_id, initial_trust=val_acc)
-
-    # Update trust for this client
-    update_trust(trust_graph, update.client_id, val_acc)
-
-    # Append weights for this client
-    client_updates[update.client_id].append(np.array(client_weights, dtype=object))
-
-    # --- Simulate noisy node contributes once per round ---
-    decay_factor = 0.9
-    if noisy_id not in client_updates:
-        client_updates[noisy_id] = []
-        # Generate noisy update (randomized)
-        noisy_weights = [w + np.random.normal(0, 0.5, w.shape) for w in client_weights]
-        client_updates[noisy_id].append(np.array(noisy_weights, dtype=object))
-        # Trust remains low
-        current_trust = trust_graph.nodes[noisy_id].get("trust", 0.2)
-        new_trust = max(0.0, current_trust * decay_factor)  # avoid going below 0
-        update_trust(trust_graph, noisy_id, new_trust)
-
-
-    # --- Federated averaging with trust weighting ---
-    if len(client_updates) >= expected_clients:
-        all_client_weights = []
-
-        # Average multiple submissions per client
-        for updates_per_client in client_updates.values():
-            client_avg = []
-            for layer_weights in zip(*updates_per_client):
-                client_avg.append(np.mean(layer_weights, axis=0))
-            all_client_weights.append(client_avg)
-
-        # Weighted aggregation using trust scores
-        new_weights = []
-        for layer_idx in range(len(all_client_weights[0])):
-            weighted_sum = sum(
-                trust_graph.nodes[c]['trust'] * all_client_weights[i][layer_idx]
-                for i, c in enumerate(client_updates.keys())
-            )
-            total_trust = sum(trust_graph.nodes[c]['trust'] for c in client_updates.keys())
-            new_weights.append(weighted_sum / total_trust)
-
-        # Set new global model
-        global_model.set_weights(new_weights)
-        global_model_state = new_weights
-
-        # Reset for next round
-        client_updates = {}
-        
-        return {"status": "Aggregated", "new_global_model": "ready"}
-    else:
-        return {"status": f"Waiting for {expected_clients - len(client_updates)} more clients"}
-
-@app.post("/recommend")
-def recommend(req: RecommendRequest):
-    global global_model
-
-    if len(req.user_vector) != 16:
-        return {"error": f"user_vector must be exactly 16 dimensions, got {len(req.user_vector)}"}
-
-    user_vec = np.array(req.user_vector, dtype=np.float32)
-
-    videos = supabase_client.table("videos").select("id, gen_vector, url").execute().data
-
-    top_k = req.top_k
-    num_random = max(1, int(top_k * 0.2))
-
-    # If user vector is zero, return fully random recommendations
-    if np.all(user_vec == 0):
-        random.shuffle(videos)
-        top_videos = [{"id": v["id"], "url": v["url"]} for v in videos[:top_k]]
-        return {"recommendations": top_videos}
-
-    # Convert to tensor for model
-    user_vec_tf = tf.convert_to_tensor([user_vec], dtype=tf.float32)
-
-    # Compute scores
-    scored_videos = []
-    for v in videos:
-        if len(v.get("gen_vector", [])) != 16:
-            continue
-        video_vec_tf = tf.convert_to_tensor([v["gen_vector"]], dtype=tf.float32)
-        score = global_model.forward(user_vec_tf, video_vec_tf).numpy().item()
-        scored_videos.append((v["id"], score, v["url"]))
-
-    # Sort by score descending
-    scored_videos.sort(key=lambda x: x[1], reverse=True)
-
-    # Separate top-ranked and random candidates
-    top_ranked = scored_videos[:top_k - num_random]
-    selected_ids = {vid for vid, _, _ in top_ranked}
-    remaining_videos = [v for v in videos if v["id"] not in selected_ids]
-    random_videos = random.sample(remaining_videos, min(num_random, len(remaining_videos)))
-    random_videos_formatted = [{"id": v["id"], "url": v["url"]} for v in random_videos]
-    top_ranked_formatted = [{"id": vid, "url": url} for vid, _, url in top_ranked]
-
-    # Interleave random videos evenly
+    # turn away updates outside the round's cohort before decoding them
+    with span("update_model.admit"):
+        rejected = aggregator.admit(update.client_id, update.round)
+    if rejected:
+        return rejected
+    with span("update_model.decode"):
+        client_weights = [np.asarray(w, dtype=np.float32) for w in update.weights]
+    with span("update_model.submit"):
+        return aggregator.submit(update.client_id, client_weights, update.round)
+
+@app.post("/catalog/refresh")
+def refresh_catalog():
+    version = aggregator.refresh_catalog(fetch_catalog_rows())
+    return {"status": "Published", "catalog_version": version}
+
+def sample_rows(n, k, exclude=(), is_seen=None):
+    """
+    k distinct random row indices out of n, skipping `exclude` and rows for
+    which is_seen(rows) is set, without an O(n) permutation.
+    """
+    exclude = set(int(r) for r in exclude)
+    k = min(k, n - len(exclude))
+    if k <= 0:
+        return []
+    # oversample when rows are filtered; a user who has seen nearly everything may get fewer
+    candidates = random.sample(range(n), min(n, (k if is_seen is None else 4 * k) + len(exclude)))
+    candidates = [r for r in candidates if r not in exclude]
+    if is_seen is not None and candidates:
+        candidates = [r for r, seen in zip(candidates, is_seen(np.array(candidates))) if not seen]
+    return candidates[:k]
+
+def slate_rows(user_vec, model_version, catalog, k, is_seen=None):
+    """The k best unseen rows from this user's precomputed slate, or None if there is no fresh one with enough."""
+    slates = state.slates()
+    if slates is None:
+        return None
+    rows = slates.get(slate_key(user_vec), model_version, catalog.version)
+    if rows is None:
+        return None
+    rows = np.asarray(rows)
+    if is_seen is not None:
+        rows = rows[~is_seen(rows)]
+    return rows[:k] if len(rows) >= k else None
+
+def interleave(top_ranked_formatted, random_videos_formatted):
+    """Spread the random picks evenly through the ranked list, always starting with the best video."""
     final_recommendations = []
 
     # Always start with first top-ranked video
@@ -219,18 +258,79 @@ def recommend(req: RecommendRequest):
                 random_idx += 1
     else:
         final_recommendations.extend(remaining_top)
+    return final_recommendations
 
-    # Ensure final length does not exceed top_k
-    return {"recommendations": final_recommendations[:top_k]}
+@app.post("/recommend")
+def recommend(req: RecommendRequest):
+    if len(req.user_vector) != 16:
+        return {"error": f"user_vector must be exactly 16 dimensions, got {len(req.user_vector)}"}
 
+    user_vec = np.array(req.user_vector, dtype=np.float32)
+
+    # Same snapshot for every worker: (N, 16) gen_vector matrix, ids and urls
+    with span("recommend.catalog"):
+        catalog = state.catalog()
+    if catalog is None or len(catalog) == 0:
+        return {"recommendations": []}
+
+    top_k = req.top_k
+    num_random = max(1, int(top_k * 0.2))
+
+    # What the user has already watched; checked per row until a full mask is needed
+    packed, is_seen = None, None
+    if req.user_id:
+        with span("recommend.seen"):
+            packed = aggregator.seen_filter(req.user_id)
+        if packed is not None:
+            is_seen = lambda rows: seen_ids(packed, catalog.ids[rows])
+
+    # If user vector is zero, return fully random recommendations
+    if np.all(user_vec == 0):
+        return {"recommendations": [catalog.item(r) for r in sample_rows(len(catalog), top_k, is_seen=is_seen)]}
+
+    # Precomputed slate for this vector, scored when the current model/catalog was published
+    model_version, weights = state.model()
+    with span("recommend.slate"):
+        top_ranked = slate_rows(user_vec, model_version, catalog, top_k - num_random, is_seen)
+    slate_requests.inc(result="miss" if top_ranked is None else "hit")
+
+    if top_ranked is None:
+        # Score the whole catalog with the published weights, keeping only the best rows
+        with span("recommend.score"):
+            seen = seen_masker.mask(packed, catalog) if packed is not None else None
+            # int8 catalogs are scored as stored; dequantization is folded into the first layer
+            weights = fold_dequantization(weights, catalog.scale, catalog.offset)
+            top_ranked = scorer.top_k(weights, user_vec, catalog.vectors, top_k - num_random, exclude=seen)
+        # have the slate builder cover this vector next time
+        aggregator.note_requester(req.user_vector)
+
+    # Random candidates from the rest
+    with span("recommend.explore"):
+        random_rows = sample_rows(len(catalog), num_random, exclude=top_ranked, is_seen=is_seen)
+
+    with span("recommend.format"):
+        top_ranked_formatted = [catalog.item(r) for r in top_ranked]
+        random_videos_formatted = [catalog.item(r) for r in random_rows]
+        # Ensure final length does not exceed top_k
+        recommendations = interleave(top_ranked_formatted, random_videos_formatted)[:top_k]
+    return {"recommendations": recommendations}
+
+
+@app.post("/seen")
+def record_seen(batch: WatchEvents):
+    """Bulk watch events; later /recommend calls with the same user_id skip these videos."""
+    pairs = [(e.user_id, video_id) for e in batch.events for video_id in e.video_ids]
+    users = aggregator.mark_seen(pairs)
+    return {"status": "Recorded", "users": users, "videos": len(pairs)}
 
 @app.get("/user_vector")
 def get_user_vectors():
-    # Convert all np.ndarrays to lists for JSON serialization
-    all_vectors = {user_id: vec.tolist() for user_id, vec in client_vectors.items()}
-    
-    return {"client_vectors": all_vectors}
+    return {"client_vectors": aggregator.user_vectors()}
 
 @app.get("/trust_graph")
 def get_trust_graph():
-    return trust_graph_to_json(trust_graph)
+    return aggregator.trust_graph_json()
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
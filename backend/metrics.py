@@ -0,0 +1,316 @@
+import bisect
+import collections
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000, 10000)
+EXPORT_SECONDS = 5
+
+
+# -----------------------------
+# Metric types
+# -----------------------------
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(l, "")) for l in self.labels)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(values, key, value):
+        values[key] = values.get(key, 0) + value
+
+    def lines(self, values):
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in sorted(values.items())]
+
+
+class Gauge(_Metric):
+    """Last value set in each process; merged across workers as the max."""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    @staticmethod
+    def merge(values, key, value):
+        values[key] = max(values.get(key, value), value)
+
+    def lines(self, values):
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # per-bucket counts (last slot is +Inf), then sum
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def merge(self, values, key, value):
+        counts = values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+        for i, v in enumerate(value):
+            counts[i] += v
+
+    def lines(self, values):
+        out = []
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts[:-1]):
+                cumulative += n
+                out.append(f"{self.name}_bucket{self._format_labels(key, [('le', bound)])} {cumulative}")
+            out.append(f"{self.name}_sum{self._format_labels(key)} {counts[-1]}")
+            out.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return out
+
+
+# -----------------------------
+# Registry
+# -----------------------------
+class Registry:
+    """
+    Metrics of this process, rendered in Prometheus text format.
+
+    Under serve.py every process (workers and the aggregator) writes a JSON
+    snapshot to a shared directory every few seconds, and render() adds the
+    other processes' snapshots to its own live values, so any worker can
+    answer /metrics for the whole server.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.directory = None
+
+    def _add(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def snapshot(self):
+        out = {}
+        for name, metric in self.metrics.items():
+            with metric.lock:
+                out[name] = [[list(key), value] for key, value in metric.values.items()]
+        return out
+
+    def _peer_snapshots(self):
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        snapshots = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json") or name == f"{os.getpid()}.json":
+                continue
+            pid = int(name[:-5])
+            try:
+                os.kill(pid, 0)
+            except OSError:
+                continue  # exited worker; its counters go with it, like a restart
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        peers = self._peer_snapshots()
+        lines = []
+        for name, metric in self.metrics.items():
+            with metric.lock:
+                values = {key: list(v) if isinstance(v, list) else v for key, v in metric.values.items()}
+            for snapshot in peers:
+                for key, value in snapshot.get(name, []):
+                    metric.merge(values, tuple(key), value)
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.lines(values))
+        return "\n".join(lines) + "\n"
+
+    def start_export(self, directory, interval=EXPORT_SECONDS):
+        """Write this process's snapshot to directory/<pid>.json every `interval` seconds."""
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+
+        def loop():
+            while True:
+                tmp = path + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(tmp, path)
+                time.sleep(interval)
+
+        threading.Thread(target=loop, daemon=True).start()
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram("stage_seconds", "Time spent in a named stage", ["stage"])
+request_seconds = registry.histogram("http_request_duration_seconds", "HTTP request latency",
+                                     ["method", "path", "status"])
+requests_total = registry.counter("http_requests_total", "HTTP requests", ["method", "path", "status"])
+request_bytes = registry.counter("http_request_bytes_total", "HTTP request body bytes", ["path"])
+response_bytes = registry.counter("http_response_bytes_total", "HTTP response body bytes", ["path"])
+
+
+@contextmanager
+def span(name):
+    """Time a block into stage_seconds{stage=name}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=name)
+
+
+# -----------------------------
+# Slow-request sampling profiler
+# -----------------------------
+class SlowRequestProfiler:
+    """
+    Opt-in (PROFILE_SLOW_MS): while requests are in flight, a background
+    thread samples every thread's Python stack each `interval` seconds.
+    When a request takes longer than the threshold, the samples taken during
+    it are written as collapsed stacks (flamegraph.pl / speedscope input) to
+    `directory`. Samples cover all threads, so concurrent requests overlap.
+    """
+
+    def __init__(self, threshold_ms, directory="profiles", interval=0.005, max_samples=20000):
+        self.threshold = threshold_ms / 1000
+        self.directory = directory
+        self.interval = interval
+        self.samples = collections.deque(maxlen=max_samples)
+        self.active = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            self.wake.wait()
+            now = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples.append((now, ";".join(reversed(stack))))
+            time.sleep(self.interval)
+
+    def start(self):
+        with self.lock:
+            self.active += 1
+            self.wake.set()
+        return time.perf_counter()
+
+    def finish(self, started, label):
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.active -= 1
+            if not self.active:
+                self.wake.clear()
+        if elapsed < self.threshold:
+            return None
+        stacks = collections.Counter(stack for t, stack in list(self.samples) if t >= started)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{label.strip('/').replace('/', '_') or 'root'}-{int(elapsed * 1000)}ms.txt")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+# -----------------------------
+# ASGI middleware
+# -----------------------------
+class MetricsMiddleware:
+    """Request count, latency and body bytes per route; feeds the slow-request profiler when enabled."""
+
+    def __init__(self, app, profiler=None):
+        self.app = app
+        self.profiler = profiler
+        if profiler is None and os.environ.get("PROFILE_SLOW_MS"):
+            self.profiler = SlowRequestProfiler(float(os.environ["PROFILE_SLOW_MS"]))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        profile_start = self.profiler.start() if self.profiler else None
+        state = {"status": 500, "in": 0, "out": 0}
+
+        async def counting_receive():
+            message = await receive()
+            state["in"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["out"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            route = scope.get("route")
+            # template path keeps label cardinality bounded; paths without a route share fixed labels
+            path = getattr(route, "path", None) or ("unmatched" if state["status"] == 404 else "other")
+            labels = {"method": scope["method"], "path": path, "status": state["status"]}
+            request_seconds.observe(time.perf_counter() - start, **labels)
+            requests_total.inc(**labels)
+            request_bytes.inc(state["in"], path=path)
+            response_bytes.inc(state["out"], path=path)
+            if self.profiler:
+                self.profiler.finish(profile_start, path)
@@ -0,0 +1,175 @@
+import math
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import COUNT_BUCKETS, registry
+
+ROUND_DEADLINE = float(os.environ.get("ROUND_DEADLINE", "60"))  # seconds a round stays open
+OVERPROVISION = 1.3          # cohort size / quorum, covering selected devices that never report
+AVAILABILITY_WINDOW = 600    # seconds since its last check-in for a device to be sampled
+MIN_UPDATES = 1              # updates a round needs at its deadline to aggregate; with fewer it is abandoned
+LATE_WEIGHT = 0.5            # weight of an update that missed its round, carried into the next one
+MAX_DEVICES = int(os.environ.get("ROUND_MAX_DEVICES", "100000"))
+DEFAULT_TRUST = 0.5
+EWMA = 0.2                   # smoothing of per-device availability and latency
+
+round_number = registry.gauge("fl_round", "Current federated round")
+round_cohort = registry.histogram("fl_round_cohort", "Devices selected per round", buckets=COUNT_BUCKETS)
+round_seconds = registry.histogram("fl_round_seconds", "Round open to close",
+                                   buckets=(1, 5, 10, 30, 60, 120, 300, 600))
+round_closes = registry.counter("fl_round_closes_total", "Rounds closed, by reason", ["reason"])
+admissions = registry.counter("fl_update_admissions_total", "Client updates by admission result", ["result"])
+
+
+class RoundScheduler:
+    """
+    Decides which devices train in each round and when the round ends.
+
+    Devices check in (check_in) and are tracked in flat arrays: last
+    check-in, trust (mirrored from the trust graph), availability (how often
+    a selected device reported in time) and latency (selection to update),
+    both smoothed. A round opens with a cohort of ceil(quorum * overprovision)
+    devices sampled without replacement from those seen in the last
+    `window` seconds, weighted by trust * availability * the chance of
+    beating the deadline; while the cohort has room, devices that check in
+    are enrolled directly, so small fleets still fill rounds. The owner
+    closes the round at the quorum or the deadline, whichever comes first.
+
+    An update from a device of the previous round's cohort that did not
+    report is "late" and is carried into the current round at LATE_WEIGHT;
+    anything else outside the current cohort is rejected before its weights
+    are decoded. Not thread-safe: the aggregator calls it under its lock.
+    """
+
+    def __init__(self, quorum, deadline=ROUND_DEADLINE, overprovision=OVERPROVISION,
+                 window=AVAILABILITY_WINDOW, max_devices=MAX_DEVICES, seed=None):
+        self.quorum = quorum
+        self.deadline = deadline
+        self.cohort_size = math.ceil(quorum * overprovision)
+        self.window = window
+        self.rng = np.random.default_rng(seed)
+        self.last_seen = np.full(max_devices, -np.inf)
+        self.trust = np.full(max_devices, DEFAULT_TRUST, np.float32)
+        self.availability = np.full(max_devices, 0.5, np.float32)
+        self.latency = np.full(max_devices, deadline / 2, np.float32)
+        self.slots = OrderedDict()   # client_id -> slot, least recently seen first
+        self.clients = [None] * max_devices
+        self.round = 0
+        self.is_open = False
+        self.opened_at = self.closes_at = 0.0
+        self.cohort = {}             # client_id -> selection time, current round
+        self.reported = set()
+        self.stragglers = {}         # previous round's cohort that never reported -> selection time
+
+    def _slot(self, client_id):
+        slot = self.slots.get(client_id)
+        if slot is not None:
+            self.slots.move_to_end(client_id)
+            return slot
+        if len(self.slots) < len(self.clients):
+            slot = len(self.slots)
+        else:
+            _, slot = self.slots.popitem(last=False)
+        self.clients[slot] = client_id
+        self.last_seen[slot] = -np.inf
+        self.trust[slot] = DEFAULT_TRUST
+        self.availability[slot] = 0.5
+        self.latency[slot] = self.deadline / 2
+        self.slots[client_id] = slot
+        return slot
+
+    def set_trust(self, client_id, trust):
+        self.trust[self._slot(client_id)] = trust
+
+    # -----------------------------
+    # Rounds
+    # -----------------------------
+    def open(self, now):
+        """Start the next round with a freshly sampled cohort."""
+        self.round += 1
+        self.is_open = True
+        self.opened_at = now
+        self.closes_at = now + self.deadline
+        self.cohort = dict.fromkeys(self._sample(now), now)
+        self.reported = set()
+        round_number.set(self.round)
+
+    def _sample(self, now):
+        n = len(self.slots)
+        active = np.flatnonzero(self.last_seen[:n] >= now - self.window)
+        if len(active) <= self.cohort_size:
+            return [self.clients[s] for s in active]
+        on_time = self.deadline / (self.deadline + self.latency[active])
+        weights = np.maximum(self.trust[active] * self.availability[active] * on_time, 1e-6)
+        # weighted sampling without replacement: the k largest u ** (1 / w) (Efraimidis-Spirakis)
+        keys = np.log(self.rng.random(len(active))) / weights
+        chosen = active[np.argpartition(-keys, self.cohort_size)[:self.cohort_size]]
+        return [self.clients[s] for s in chosen]
+
+    def expired(self, now):
+        return self.is_open and now >= self.closes_at
+
+    def close(self, now, reason):
+        """End the current round; its silent cohort members may still report late to the next one."""
+        for client_id in self.cohort.keys() - self.reported:
+            slot = self.slots.get(client_id)
+            if slot is not None:
+                self.availability[slot] *= 1 - EWMA
+        self.stragglers = {c: t for c, t in self.cohort.items() if c not in self.reported}
+        round_cohort.observe(len(self.cohort))
+        round_seconds.observe(now - self.opened_at)
+        round_closes.inc(reason=reason)
+        self.is_open = False
+        self.cohort = {}
+
+    # -----------------------------
+    # Devices
+    # -----------------------------
+    def check_in(self, client_id, now):
+        """Record that the device is reachable; its assignment for the current round."""
+        self.last_seen[self._slot(client_id)] = now
+        if not self.is_open:
+            self.open(now)
+        selected = self._enroll(client_id, now)
+        remaining = max(0.0, self.closes_at - now)
+        out = {"round": self.round, "selected": selected, "deadline": round(remaining, 3)}
+        if not selected:
+            out["retry_after"] = round(remaining, 3)
+        return out
+
+    def _enroll(self, client_id, now):
+        if client_id not in self.cohort and len(self.cohort) < self.cohort_size:
+            self.cohort[client_id] = now
+        return client_id in self.cohort
+
+    def would_admit(self, client_id, round_id):
+        """What admit() would return, without enrolling, opening a round or recording the device."""
+        current = self.round if self.is_open else self.round + 1  # admit() opens the next round
+        if round_id is None or round_id == current:
+            if not self.is_open or client_id in self.cohort or len(self.cohort) < self.cohort_size:
+                return "current"
+            return "not selected for this round"
+        if round_id == current - 1 and client_id in self.stragglers:
+            return "late"
+        return "round closed" if round_id < current else "unknown round"
+
+    def admit(self, client_id, round_id, now):
+        """"current", "late" or the reason an update for `round_id` (None: the current round) is rejected."""
+        self.last_seen[self._slot(client_id)] = now
+        if not self.is_open:
+            self.open(now)
+        result = self.would_admit(client_id, round_id)
+        if result == "current":
+            self._enroll(client_id, now)
+        return result
+
+    def report(self, client_id, now, late=False):
+        """An admitted update arrived; update the device's availability and latency."""
+        slot = self._slot(client_id)
+        selected_at = self.stragglers.pop(client_id) if late else self.cohort[client_id]
+        self.latency[slot] += EWMA * (now - selected_at - self.latency[slot])
+        if not late and client_id not in self.reported:
+            self.reported.add(client_id)
+            self.availability[slot] += EWMA * (1 - self.availability[slot])
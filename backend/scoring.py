@@ -0,0 +1,152 @@
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+USER_DIM = 16    # user vector size; the model input is [user_vec, gen_vector]
+BLOCK_ROWS = 32768         # rows scored per kernel call, bounds the (rows, 128) hidden layer
+MIN_SHARD_ROWS = 65536     # below this a catalog is scored as a single shard
+SCORING_THREADS = int(os.environ.get("SCORING_THREADS", "1"))
+
+
+def init_weights(input_dim=32, hidden_dim=128, seed=None):
+    """
+    Fresh BinaryMLP weights as Keras initializes Dense layers (Glorot-uniform
+    kernels, zero biases), so the server can start a model without TensorFlow.
+    """
+    rng = np.random.default_rng(seed)
+    weights = []
+    for fan_in, fan_out in ((input_dim, hidden_dim), (hidden_dim, hidden_dim), (hidden_dim, 1)):
+        limit = np.sqrt(6 / (fan_in + fan_out))
+        weights.append(rng.uniform(-limit, limit, (fan_in, fan_out)).astype(np.float32))
+        weights.append(np.zeros(fan_out, np.float32))
+    return weights
+
+
+def mlp_scores(weights, user_vec, videos):
+    """
+    BinaryMLP forward pass in NumPy for one user against a (N, 16) block of
+    gen_vectors, returning (N,) like-probabilities.
+
+    The user's half of the first layer is computed once instead of being
+    concatenated onto every video row. Works directly on memory-mapped weights;
+    a float16/int8 block is cast to float32 here (for int8, pass weights
+    through fold_dequantization first).
+    """
+    W1, b1, W2, b2, W3, b3 = weights
+    user_part = np.asarray(user_vec, np.float32) @ W1[:USER_DIM] + b1
+    hidden = np.maximum(np.asarray(videos, np.float32) @ W1[USER_DIM:] + user_part, 0)
+    hidden = np.maximum(hidden @ W2 + b2, 0)
+    logits = hidden @ W3[:, 0] + b3[0]
+    return 1.0 / (1.0 + np.exp(-logits))
+
+
+def fold_dequantization(weights, scale, offset):
+    """
+    Weights that score int8 catalog rows q directly: since the video vector is
+    q * scale + offset, the video half of W1 is scaled per input and the
+    offset's contribution is added to b1. Unchanged when scale is None.
+    """
+    if scale is None:
+        return weights
+    W1, b1, *rest = weights
+    W1_video = W1[USER_DIM:] * scale[:, None]
+    return [np.vstack([W1[:USER_DIM], W1_video]), b1 + offset @ W1[USER_DIM:], *rest]
+
+
+def top_k_rows(scores, k):
+    """Row indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def block_top_k(weights, user_vec, videos, k, offset=0, block_rows=BLOCK_ROWS, exclude=None):
+    """
+    (scores, rows) of the k best rows of `videos`, best first, scored in
+    blocks of block_rows so memory stays flat for any catalog size.
+    Returned rows are shifted by `offset` (the shard's first catalog row).
+    Rows where the bool mask `exclude` (aligned with `videos`) is set are
+    never returned.
+    """
+    best_scores = np.empty(0, np.float32)
+    best_rows = np.empty(0, np.int64)
+    for start in range(0, len(videos), block_rows):
+        scores = mlp_scores(weights, user_vec, videos[start:start + block_rows])
+        if exclude is not None:
+            scores[exclude[start:start + block_rows]] = -np.inf
+        idx = top_k_rows(scores, k)
+        idx = idx[np.isfinite(scores[idx])]
+        best_scores = np.concatenate([best_scores, scores[idx]])
+        best_rows = np.concatenate([best_rows, idx + offset + start])
+        keep = top_k_rows(best_scores, k)
+        best_scores, best_rows = best_scores[keep], best_rows[keep]
+    return best_scores, best_rows
+
+
+def batch_top_k(weights, user_vecs, videos, k, block_rows=4096):
+    """
+    (U, k) best catalog rows for each of U users, best first, in one pass over
+    the catalog: each block's video half of the first layer is computed once
+    and shared by the whole batch, and the second layer runs as one matmul
+    over (U * block_rows) rows. Ranks by logit (same order as the sigmoid).
+    """
+    W1, b1, W2, b2, W3, b3 = weights
+    user_parts = np.asarray(user_vecs, np.float32) @ W1[:USER_DIM] + b1
+    users = len(user_parts)
+    best_scores = np.empty((users, 0), np.float32)
+    best_rows = np.empty((users, 0), np.int64)
+    for start in range(0, len(videos), block_rows):
+        video_part = np.asarray(videos[start:start + block_rows], np.float32) @ W1[USER_DIM:]
+        n = len(video_part)
+        hidden = np.maximum(video_part[None] + user_parts[:, None], 0).reshape(users * n, -1)
+        hidden = np.maximum(hidden @ W2 + b2, 0)
+        scores = (hidden @ W3[:, 0] + b3[0]).reshape(users, n)
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + n), (users, n))], axis=1)
+        keep = min(k, scores.shape[1])
+        idx = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+        best_scores = np.take_along_axis(scores, idx, axis=1)
+        best_rows = np.take_along_axis(rows, idx, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return np.take_along_axis(best_rows, order, axis=1)
+
+
+class ShardedScorer:
+    """
+    Top-k over a large catalog split into row shards scored on a thread pool.
+
+    Shards are slices of the memory-mapped catalog matrix (no copies); the
+    matmuls and ufuncs in mlp_scores release the GIL, so shards run on
+    separate cores. Each shard keeps its own top-k and the sorted per-shard
+    lists are heap-merged. With several uvicorn workers, keep
+    workers x threads around the core count (and OPENBLAS_NUM_THREADS=1).
+    """
+
+    def __init__(self, threads=SCORING_THREADS, min_shard_rows=MIN_SHARD_ROWS, block_rows=BLOCK_ROWS):
+        self.threads = max(1, threads)
+        self.min_shard_rows = min_shard_rows
+        self.block_rows = block_rows
+        self.pool = ThreadPoolExecutor(self.threads) if self.threads > 1 else None
+
+    def shards(self, n):
+        """[(start, stop)] row ranges: one per thread, but none smaller than min_shard_rows."""
+        count = max(1, min(self.threads, n // self.min_shard_rows))
+        bounds = np.linspace(0, n, count + 1).astype(np.int64)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def top_k(self, weights, user_vec, videos, k, exclude=None):
+        """Catalog rows of the k highest scores, best first, skipping rows set in the `exclude` mask."""
+        shards = self.shards(len(videos))
+        if self.pool is None or len(shards) == 1:
+            return block_top_k(weights, user_vec, videos, k, block_rows=self.block_rows, exclude=exclude)[1]
+        futures = [self.pool.submit(block_top_k, weights, user_vec, videos[start:stop], k, start, self.block_rows,
+                                    None if exclude is None else exclude[start:stop])
+                   for start, stop in shards]
+        # each shard's list is sorted best first; merge on (-score, row)
+        merged = heapq.merge(*[zip(-scores, rows) for scores, rows in (f.result() for f in futures)])
+        return np.array([row for _, row in islice(merged, k)], np.int64)
@@ -0,0 +1,321 @@
+"""
+Benchmarks for the recommendation and aggregation hot paths.
+
+    python scripts/benchmarks.py --out bench.json
+    python scripts/benchmarks.py --quick --baseline bench.json
+
+Catalogs and client fleets are synthetic, built like training.py (seeded
+random gen_vectors, animal/scenery lover users). Results are written as JSON;
+with --baseline every metric is compared against a saved run and the script
+exits non-zero when one regresses by more than --tolerance (p95 and mean
+latencies are reported but not gated).
+
+Suites: recommend (scoring path vs catalog size), aggregation (time and peak
+memory vs clients and hidden size), serialization (/get_global_model and
+/update_model payloads), fit_with_dp (examples/sec, needs TensorFlow),
+quantized (catalog bytes/video, latency and top-k agreement with float32
+per CATALOG_DTYPE).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# backend modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregator import Aggregator  # noqa: E402
+from scoring import ShardedScorer, fold_dequantization, mlp_scores, top_k_rows  # noqa: E402
+from shared_state import DTYPES, SharedState  # noqa: E402
+
+# ----------------------------
+# Parameters
+# ----------------------------
+embedding_dim = 16  # 8 animal + 8 scenery
+input_dim = 32      # [user_vec, gen_vector]
+CATALOG_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+CLIENT_COUNTS = [2, 10, 50, 200]
+HIDDEN_DIMS = [64, 128, 256]
+QUICK_CATALOG_SIZES = [1_000, 10_000, 100_000]
+QUICK_CLIENT_COUNTS = [2, 10, 50]
+QUICK_HIDDEN_DIMS = [128]
+TOP_K = 10
+QUANTIZED_VIDEOS = 1_000_000
+QUICK_QUANTIZED_VIDEOS = 100_000
+AGREEMENT_USERS = 50
+TOLERANCE = 0.15
+REPORT_ONLY = ("p95_ms", "mean_ms")  # too noisy on shared machines to fail a run
+
+
+# ----------------------------
+# Synthetic data
+# ----------------------------
+def video_embeddings(num_videos, seed=42):
+    return np.random.default_rng(seed).random((num_videos, embedding_dim), dtype=np.float32)
+
+
+def user_embeddings(num_users, seed=42):
+    """Animal and scenery lovers with small noise, alternating."""
+    rng = np.random.default_rng(seed)
+    animal_lover = np.array([0.8] * 8 + [0.2] * 8, np.float32)
+    scenery_lover = np.array([0.2] * 8 + [0.8] * 8, np.float32)
+    base = np.stack([animal_lover if i % 2 == 0 else scenery_lover for i in range(num_users)])
+    return (base + rng.normal(0, 0.005, base.shape)).astype(np.float32)
+
+
+def mlp_weights(hidden_dim=128, seed=42):
+    """Random weights shaped like BinaryMLP(input_dim=32, hidden_dim) without building the Keras model."""
+    rng = np.random.default_rng(seed)
+    shapes = [(input_dim, hidden_dim), (hidden_dim,), (hidden_dim, hidden_dim), (hidden_dim,), (hidden_dim, 1), (1,)]
+    return [rng.normal(0, 0.1, shape).astype(np.float32) for shape in shapes]
+
+
+def training_data(num_videos=100, seed=42):
+    """X, y for one animal lover and one scenery lover, as in training.py."""
+    rng = np.random.default_rng(seed)
+    videos = video_embeddings(num_videos, seed)
+    users = user_embeddings(2, seed)
+    labels = np.array([1] * (num_videos // 2) + [0] * (num_videos - num_videos // 2))
+    flip = rng.choice(num_videos, size=max(1, num_videos // 20), replace=False)
+    labels_animal = labels.copy()
+    labels_animal[flip] = 0
+    labels_scenery = 1 - labels
+    labels_scenery[flip] = 1
+    X = np.vstack([np.hstack([np.tile(u, (num_videos, 1)), videos]) for u in users]).astype(np.float32)
+    y = np.hstack([labels_animal, labels_scenery]).astype(np.int32)
+    return X, y
+
+
+# ----------------------------
+# Timing
+# ----------------------------
+def timed(fn, repeat, warmup=1):
+    """Milliseconds per call: p50, p95 and mean over `repeat` runs after `warmup`."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples = np.array(samples)
+    return {"p50_ms": round(float(np.percentile(samples, 50)), 4),
+            "p95_ms": round(float(np.percentile(samples, 95)), 4),
+            "mean_ms": round(float(samples.mean()), 4)}
+
+
+# ----------------------------
+# Suites
+# ----------------------------
+def bench_recommend(sizes, repeat):
+    """Catalog snapshot + score + format, the work /recommend does per request."""
+    results = {}
+    weights = mlp_weights()
+    users = user_embeddings(repeat + 1)
+    scorer = ShardedScorer()
+    with tempfile.TemporaryDirectory() as root:
+        state = SharedState(root)
+        state.publish_model(weights)
+        for n in sizes:
+            vectors = video_embeddings(n)
+            state.publish_catalog([str(i) for i in range(n)], vectors, [f"https://cdn/{i}.mp4" for i in range(n)])
+            _, model = state.model()
+            calls = iter(users.tolist() * 2)
+
+            def recommend():
+                catalog = state.catalog()
+                rows = scorer.top_k(model, np.array(next(calls), np.float32), catalog.vectors, TOP_K)
+                return [catalog.item(r) for r in rows]
+
+            results[f"recommend/videos={n}"] = timed(recommend, repeat)
+    return results
+
+
+def bench_aggregation(client_counts, hidden_dims):
+    """One full round: every client submits once, the last submit aggregates and publishes."""
+    results = {}
+    for hidden_dim in hidden_dims:
+        weights = mlp_weights(hidden_dim)
+        for clients in client_counts:
+            fleet = [[w + np.float32(0.01 * i) for w in weights] for i in range(clients)]
+            with tempfile.TemporaryDirectory() as root, contextlib.redirect_stdout(io.StringIO()):
+                # the aggregator adds its own simulated noisy client to every round
+                aggregator = Aggregator(SharedState(root), weights, expected_clients=clients + 1)
+                tracemalloc.start()
+                start = time.perf_counter()
+                for i, client_weights in enumerate(fleet):
+                    response = aggregator.submit(f"client_{i}", client_weights)
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            assert response["status"] == "Aggregated", response
+            results[f"aggregation/clients={clients}/hidden={hidden_dim}"] = {
+                "round_ms": round(elapsed * 1000, 3),
+                "per_client_ms": round(elapsed * 1000 / clients, 4),
+                "peak_mb": round(peak / 2**20, 3),
+            }
+    return results
+
+
+def bench_serialization(hidden_dims, repeat):
+    """JSON encode of the /get_global_model body and decode of an /update_model body."""
+    results = {}
+    for hidden_dim in hidden_dims:
+        weights = mlp_weights(hidden_dim)
+        body = json.dumps({"weights": [w.tolist() for w in weights]})
+        update = json.dumps({"client_id": "bench", "weights": [w.tolist() for w in weights]})
+        results[f"serialization/get_global_model/hidden={hidden_dim}"] = {
+            **timed(lambda: json.dumps({"weights": [w.tolist() for w in weights]}), repeat),
+            "payload_bytes": len(body),
+        }
+        results[f"serialization/update_model/hidden={hidden_dim}"] = {
+            **timed(lambda: [np.asarray(w, dtype=np.float32) for w in json.loads(update)["weights"]], repeat),
+            "payload_bytes": len(update),
+        }
+    return results
+
+
+def bench_quantized(num_videos, repeat):
+    """Each catalog storage type against float32: memory, /recommend scoring latency, recall@k."""
+    results = {}
+    weights = mlp_weights()
+    users = user_embeddings(AGREEMENT_USERS)
+    vectors = video_embeddings(num_videos)
+    # exact float32 ranking as the reference
+    reference = [set(top_k_rows(mlp_scores(weights, u, vectors), TOP_K).tolist()) for u in users]
+    scorer = ShardedScorer()
+    for dtype in DTYPES:
+        with tempfile.TemporaryDirectory() as root:
+            state = SharedState(root)
+            state.publish_catalog(list(range(num_videos)), vectors, [f"https://cdn/{i}.mp4" for i in range(num_videos)],
+                                  dtype=dtype)
+            catalog = state.catalog()
+            folded = fold_dequantization(weights, catalog.scale, catalog.offset)
+            recall = np.mean([len(ref & set(scorer.top_k(folded, u, catalog.vectors, TOP_K).tolist())) / TOP_K
+                              for u, ref in zip(users, reference)])
+            calls = iter(users.tolist() * (repeat // len(users) + 2))
+            results[f"quantized/{dtype}/videos={num_videos}"] = {
+                **timed(lambda: scorer.top_k(folded, np.array(next(calls), np.float32), catalog.vectors, TOP_K),
+                        repeat),
+                "vector_bytes": int(catalog.vectors.nbytes),
+                "bytes_per_video": round(catalog.bytes_per_video, 2),
+                "recall_at_k": round(float(recall), 4),
+            }
+            del catalog, state
+    return results
+
+
+def bench_fit_with_dp(num_videos, epochs):
+    try:
+        from model import BinaryMLP
+    except ImportError as e:
+        print(f"⚠️ Skipping fit_with_dp: {e}")
+        return {}
+    X, y = training_data(num_videos)
+    model = BinaryMLP(input_dim=input_dim, hidden_dim=128)
+    model.fit_with_dp(X[:32], y[:32], epochs=1, batch_size=16)  # trace the graph once
+    start = time.perf_counter()
+    model.fit_with_dp(X, y, epochs=epochs, batch_size=16)
+    elapsed = time.perf_counter() - start
+    return {f"fit_with_dp/examples={len(X)}": {
+        "seconds": round(elapsed, 3),
+        "examples_per_sec": round(len(X) * epochs / elapsed, 1),
+    }}
+
+
+# ----------------------------
+# Baseline comparison
+# ----------------------------
+def higher_is_better(metric):
+    return metric.endswith("_per_sec") or metric.startswith("recall")
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Rows of (benchmark, metric, baseline, current, change) and whether any metric regressed."""
+    rows, regressed = [], False
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            worse = -change if higher_is_better(metric) else change
+            # payload sizes are deterministic; any growth counts
+            limit = 0 if metric.endswith("_bytes") else tolerance
+            flag = worse > limit and metric not in REPORT_ONLY
+            regressed |= flag
+            rows.append((name, metric, old, value, change, flag))
+    return rows, regressed
+
+
+def print_comparison(rows):
+    for name, metric, old, value, change, flag in rows:
+        print(f"{'REGRESSED' if flag else 'ok':9} {name:50} {metric:16} {old:>12} -> {value:>12} ({change:+.1%})")
+
+
+# ----------------------------
+# Main
+# ----------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown fraction")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast check")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--suite", action="append",
+                        choices=["recommend", "aggregation", "serialization", "fit_with_dp", "quantized"],
+                        help="run only these suites (repeatable)")
+    args = parser.parse_args()
+
+    suites = set(args.suite or ["recommend", "aggregation", "serialization", "fit_with_dp", "quantized"])
+    sizes = QUICK_CATALOG_SIZES if args.quick else CATALOG_SIZES
+    clients = QUICK_CLIENT_COUNTS if args.quick else CLIENT_COUNTS
+    hidden_dims = QUICK_HIDDEN_DIMS if args.quick else HIDDEN_DIMS
+
+    results = {}
+    if "recommend" in suites:
+        results.update(bench_recommend(sizes, args.repeat))
+    if "aggregation" in suites:
+        results.update(bench_aggregation(clients, hidden_dims))
+    if "serialization" in suites:
+        results.update(bench_serialization(hidden_dims, args.repeat))
+    if "fit_with_dp" in suites:
+        results.update(bench_fit_with_dp(100 if args.quick else 1000, epochs=1 if args.quick else 3))
+    if "quantized" in suites:
+        results.update(bench_quantized(QUICK_QUANTIZED_VIDEOS if args.quick else QUANTIZED_VIDEOS, args.repeat))
+
+    for name, metrics in results.items():
+        print(f"{name:50} {metrics}")
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpus": os.cpu_count(),
+            "quick": args.quick,
+            "scoring_threads": ShardedScorer().threads,
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        rows, regressed = compare(results, baseline, args.tolerance)
+        print_comparison(rows)
+        if regressed:
+            sys.exit(1)
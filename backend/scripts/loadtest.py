@@ -0,0 +1,150 @@
+"""
+Load driver: simulated devices training and fetching recommendations.
+
+    DATA_BACKEND=local python datastore.py seed --videos 100000
+    DATA_BACKEND=local python serve.py --workers 4 --port 8000
+    python scripts/loadtest.py --devices 2000 --duration 60 --out load.json
+
+Each device is a coroutine that, after an exponential think time, either
+runs a training round (POST /local/train, which fetches the global model and
+posts to /update_model from the server) or asks for recommendations (POST
+/recommend). With --direct a round is done the way a phone would: GET
+/round, and if selected GET /get_global_model, perturb locally, POST
+/update_model. Reports throughput
+and latency percentiles per endpoint, as text and optionally JSON.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+import numpy as np
+
+embedding_dim = 16  # 8 animal + 8 scenery
+PERCENTILES = (50, 90, 99)
+
+
+# ----------------------------
+# Simulated devices
+# ----------------------------
+class Device:
+    """One client: a noisy animal or scenery lover with a few labelled videos."""
+
+    def __init__(self, index, examples, rng):
+        self.client_id = f"device_{index}"
+        lover = np.array([0.8] * 8 + [0.2] * 8) if index % 2 == 0 else np.array([0.2] * 8 + [0.8] * 8)
+        self.user_vector = lover + rng.normal(0, 0.005, embedding_dim)
+        videos = rng.random((examples, embedding_dim))
+        # likes videos leaning the same way as the user
+        liked = (videos[:, :8].sum(1) > videos[:, 8:].sum(1)) == (index % 2 == 0)
+        self.X = np.hstack([np.tile(self.user_vector, (examples, 1)), videos]).round(4).tolist()
+        self.y = liked.astype(int).tolist()
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed):
+        out = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            ms = np.array(samples) * 1000
+            out[endpoint] = {
+                "requests": len(samples),
+                "errors": self.errors.get(endpoint, 0),
+                "throughput_rps": round(len(samples) / elapsed, 2),
+                **{f"p{p}_ms": round(float(np.percentile(ms, p)), 2) for p in PERCENTILES},
+                "max_ms": round(float(ms.max()), 2),
+            }
+        return out
+
+
+async def call(client, stats, endpoint, method, path, **kwargs):
+    start, ok = time.perf_counter(), False
+    try:
+        response = await client.request(method, path, **kwargs)
+        ok = response.status_code < 400 and "error" not in response.text[:200]
+        return response if ok else None
+    except httpx.HTTPError:
+        return None
+    finally:
+        stats.record(endpoint, time.perf_counter() - start, ok)
+
+
+async def train_round(client, stats, device, direct):
+    if not direct:
+        await call(client, stats, "/local/train", "POST", "/local/train",
+                   json={"client_id": device.client_id, "X": device.X, "y": device.y})
+        return
+    response = await call(client, stats, "/round", "GET", "/round", params={"client_id": device.client_id})
+    if response is None or not response.json()["selected"]:
+        return
+    round_id = response.json()["round"]
+    response = await call(client, stats, "/get_global_model", "GET", "/get_global_model")
+    if response is None:
+        return
+    weights = [np.array(w) for w in response.json()["weights"]]
+    update = [(w + np.random.normal(0, 0.01, w.shape)).tolist() for w in weights]
+    if update:
+        # the aggregator reads the user vector from W1[0, :16]
+        update[0][0][:embedding_dim] = device.user_vector.tolist()
+    await call(client, stats, "/update_model", "POST", "/update_model",
+               json={"client_id": device.client_id, "weights": update, "round": round_id})
+
+
+async def run_device(client, stats, device, deadline, args):
+    rng = random.Random(device.client_id)
+    await asyncio.sleep(rng.uniform(0, args.think))  # stagger the start
+    while time.monotonic() < deadline:
+        if rng.random() < args.train_ratio:
+            await train_round(client, stats, device, args.direct)
+        else:
+            await call(client, stats, "/recommend", "POST", "/recommend",
+                       json={"user_vector": device.user_vector.tolist(), "top_k": args.top_k})
+        await asyncio.sleep(rng.expovariate(1 / args.think))
+
+
+async def main(args):
+    rng = np.random.default_rng(42)
+    devices = [Device(i, args.examples, rng) for i in range(args.devices)]
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        start = time.monotonic()
+        deadline = start + args.duration
+        await asyncio.gather(*(run_device(client, stats, d, deadline, args) for d in devices))
+        elapsed = time.monotonic() - start
+    return stats.report(elapsed), elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=60, help="seconds before devices stop sending")
+    parser.add_argument("--think", type=float, default=2.0, help="mean seconds between a device's requests")
+    parser.add_argument("--train-ratio", type=float, default=0.05, help="share of actions that are training rounds")
+    parser.add_argument("--direct", action="store_true", help="train on the device instead of via /local/train")
+    parser.add_argument("--examples", type=int, default=32, help="labelled videos per device")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--connections", type=int, default=200, help="HTTP connection pool size")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--out", help="write the report as JSON here")
+    args = parser.parse_args()
+
+    report, elapsed = asyncio.run(main(args))
+    print(f"{args.devices} devices for {elapsed:.1f}s against {args.url}")
+    for endpoint, values in report.items():
+        print(f"{endpoint:20} {values}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"config": vars(args), "elapsed": elapsed, "endpoints": report}, f, indent=2)
+        print(f"✅ Report written to {args.out}")
@@ -0,0 +1,140 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import registry
+
+SEEN_BITS = 8192          # bits per Bloom filter generation (1 KiB)
+SEEN_HASHES = 4
+SEEN_CAPACITY = 800       # ids per generation before rotating (~1% false positives)
+SEEN_MAX_USERS = int(os.environ.get("SEEN_MAX_USERS", "100000"))  # ~2 KiB each; beyond it the LRU user is dropped
+
+# odd 64-bit multipliers for multiply-shift hashing, one per hash function
+_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+                         0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9],
+                        np.uint64)
+
+seen_users = registry.gauge("seen_users", "Users with a seen-video filter")
+seen_events = registry.counter("seen_events_total", "Watched video ids recorded")
+seen_evictions = registry.counter("seen_evictions_total",
+                                  "Users whose seen filters were dropped to make room (SEEN_MAX_USERS)")
+
+
+def bloom_positions(ids, bits=SEEN_BITS, hashes=SEEN_HASHES):
+    """(len(ids), hashes) bit positions of each video id."""
+    shift = np.uint64(64 - int(bits).bit_length() + 1)
+    keys = np.asarray(ids, np.int64).astype(np.uint64)[:, None]
+    return (keys * _MULTIPLIERS[:hashes] >> shift).astype(np.uint16 if bits <= 1 << 16 else np.int64)
+
+
+class SeenStore:
+    """
+    Videos each user has watched, as Bloom filters over video ids (so they
+    survive catalog republishing, unlike row numbers).
+
+    Every user holds two generations of SEEN_BITS bits; ids go into the
+    current one, and once it has taken `capacity` ids it becomes the
+    previous one and a fresh generation starts, so old history ages out and
+    the false-positive rate stays bounded. Filters live in one preallocated
+    (max_users, 2, bits/8) array; when it is full the least recently active
+    user's slot is reused. That is intended: an evicted user simply starts
+    from an empty history again (and may be shown videos they already
+    watched), which seen_evictions_total makes visible. Size max_users to
+    the users active within the history window. Owned by the aggregator process.
+    """
+
+    def __init__(self, max_users=SEEN_MAX_USERS, bits=SEEN_BITS, hashes=SEEN_HASHES, capacity=SEEN_CAPACITY):
+        assert bits & (bits - 1) == 0, "bits must be a power of two"
+        self.bits = bits
+        self.hashes = hashes
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        # zeros is lazily backed, so untouched slots cost no memory
+        self.filters = np.zeros((max_users, 2, bits // 8), np.uint8)
+        self.counts = np.zeros((max_users, 2), np.int32)
+        self.current = np.zeros(max_users, np.int8)
+        self.slots = OrderedDict()  # user_id -> slot, least recently active first
+
+    def _slot(self, user_id):
+        slot = self.slots.get(user_id)
+        if slot is not None:
+            self.slots.move_to_end(user_id)
+            return slot
+        if len(self.slots) < len(self.filters):
+            slot = len(self.slots)
+        else:
+            _, slot = self.slots.popitem(last=False)
+            self.filters[slot] = 0
+            self.counts[slot] = 0
+            seen_evictions.inc()
+        self.slots[user_id] = slot
+        return slot
+
+    def add(self, user_id, video_ids):
+        """Record watched video ids for one user."""
+        video_ids = np.unique(np.asarray(video_ids, np.int64))
+        if not len(video_ids):
+            return
+        positions = bloom_positions(video_ids, self.bits, self.hashes)
+        with self.lock:
+            slot = self._slot(user_id)
+            done = 0
+            while done < len(positions):
+                gen = self.current[slot]
+                if self.counts[slot, gen] >= self.capacity:
+                    gen = self.current[slot] = 1 - gen
+                    self.filters[slot, gen] = 0
+                    self.counts[slot, gen] = 0
+                n = min(self.capacity - self.counts[slot, gen], len(positions) - done)
+                unpacked = np.unpackbits(self.filters[slot, gen], bitorder="little")
+                unpacked[positions[done:done + n].ravel()] = 1
+                self.filters[slot, gen] = np.packbits(unpacked, bitorder="little")
+                self.counts[slot, gen] += n
+                done += n
+            seen_users.set(len(self.slots))
+        seen_events.inc(len(video_ids))
+
+    def add_events(self, events):
+        """Bulk watch events: iterable of (user_id, video_id) pairs."""
+        by_user = {}
+        for user_id, video_id in events:
+            by_user.setdefault(user_id, []).append(video_id)
+        for user_id, video_ids in by_user.items():
+            self.add(user_id, video_ids)
+        return len(by_user)
+
+    def filter(self, user_id):
+        """Packed bits of everything the user has seen (both generations), or None."""
+        with self.lock:
+            slot = self.slots.get(user_id)
+            if slot is None:
+                return None
+            return self.filters[slot, 0] | self.filters[slot, 1]
+
+
+def seen_ids(packed, ids, bits=SEEN_BITS, hashes=SEEN_HASHES):
+    """Bool per video id: in the packed filter (cheap for a handful of ids, e.g. a precomputed slate)."""
+    unpacked = np.unpackbits(packed, bitorder="little").astype(bool)
+    return unpacked[bloom_positions(ids, bits, hashes)].all(axis=1)
+
+
+class SeenMasker:
+    """
+    Turns a user's packed filter into an (N,) mask over catalog rows. Bit
+    positions of every catalog id are computed once per catalog version, so
+    a request is one gather and an all() over the hash axis.
+    """
+
+    def __init__(self, bits=SEEN_BITS, hashes=SEEN_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self.cached = None  # (catalog version, positions), swapped as one object
+
+    def mask(self, packed, catalog):
+        cached = self.cached
+        if cached is None or cached[0] != catalog.version:
+            cached = self.cached = (catalog.version, bloom_positions(catalog.ids, self.bits, self.hashes))
+        unpacked = np.unpackbits(packed, bitorder="little").astype(bool)
+        return unpacked[cached[1]].all(axis=1)
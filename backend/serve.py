@@ -0,0 +1,47 @@
+"""
+Multi-worker serving.
+
+    python serve.py --workers 4 --port 8000
+
+This process owns the federated round (aggregator.Aggregator) and publishes
+the global model and catalog to shared memory; uvicorn workers serve main:app,
+map the published arrays, and forward /update_model to the aggregator over a
+local socket. Plain `uvicorn main:app` still runs everything in one process.
+
+For catalogs in the millions, SCORING_THREADS=N additionally shards each
+/recommend across N threads (keep workers x threads near the core count).
+"""
+import argparse
+import os
+import secrets
+import threading
+
+import uvicorn
+
+if __name__ == "__main__":
+    # imported here, not at module level: spawned workers re-import this file and
+    # must stay light enough to answer uvicorn's health pings while starting
+    from aggregator import serve_aggregator
+    from main import create_aggregator, state
+    from metrics import registry
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    registry.start_export(os.path.join(state.root, "metrics"))
+    aggregator = create_aggregator()
+
+    address = os.path.join(state.root, "aggregator.sock")
+    if os.path.exists(address):
+        os.remove(address)
+    authkey = secrets.token_bytes(16)
+    threading.Thread(target=serve_aggregator, args=(aggregator, address, authkey), daemon=True).start()
+
+    # workers inherit these and attach to the same state instead of starting their own round
+    os.environ["FL_STATE_DIR"] = state.root
+    os.environ["FL_AGGREGATOR"] = address
+    os.environ["FL_AGGREGATOR_KEY"] = authkey.hex()
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
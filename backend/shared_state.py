@@ -0,0 +1,274 @@
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+# /dev/shm is RAM-backed, so mapping files there is plain shared memory
+STATE_DIR = os.environ.get("FL_STATE_DIR") or os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "fl_state")
+KEEP_VERSIONS = 3
+POINTER = "current.json"
+# storage for catalog gen_vectors: float32 (64 B/video), float16 (32 B) or int8 (16 B, per-dimension scale)
+CATALOG_DTYPE = os.environ.get("CATALOG_DTYPE", "float32")
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+def quantize(vectors, dtype=CATALOG_DTYPE):
+    """
+    (stored, scale, offset) for an (N, dim) float matrix. int8 maps each
+    dimension's [min, max] onto the 256 levels so that
+    vectors ~= stored * scale + offset; other types are a plain cast
+    (scale and offset None).
+    """
+    vectors = np.asarray(vectors, np.float32)
+    if dtype != "int8":
+        return vectors.astype(DTYPES[dtype]), None, None
+    low = vectors.min(axis=0) if len(vectors) else np.zeros(vectors.shape[1], np.float32)
+    high = vectors.max(axis=0) if len(vectors) else np.ones(vectors.shape[1], np.float32)
+    scale = np.maximum(high - low, 1e-12) / 255
+    stored = np.clip(np.rint((vectors - low) / scale) - 128, -128, 127).astype(np.int8)
+    return stored, scale.astype(np.float32), (low + 128 * scale).astype(np.float32)
+
+
+class Catalog:
+    """
+    One published catalog version, entirely in flat memory-mapped arrays:
+    the (N, 16) gen_vector matrix as stored (see quantize; scale/offset are
+    set for int8), int64 ids with their argsort as the id -> row index, and
+    urls as one utf-8 blob with row offsets.
+    """
+
+    def __init__(self, version, ids, vectors, url_blob, url_offsets, order=None, scale=None, offset=None):
+        self.version = version
+        self.ids = ids
+        self.vectors = vectors
+        self.url_blob = url_blob
+        self.url_offsets = url_offsets
+        self.order = order if order is not None else np.argsort(ids, kind="stable")
+        self.scale = scale
+        self.offset = offset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, ids):
+        """Catalog rows of `ids` (-1 where an id is not in this version)."""
+        ids = np.asarray(ids, np.int64)
+        if len(self.ids) == 0:
+            return np.full(len(ids), -1, np.int64)
+        pos = np.minimum(np.searchsorted(self.ids, ids, sorter=self.order), len(self.ids) - 1)
+        rows = self.order[pos]
+        return np.where(self.ids[rows] == ids, rows, -1)
+
+    def url(self, row):
+        return bytes(self.url_blob[self.url_offsets[row]:self.url_offsets[row + 1]]).decode()
+
+    def item(self, row):
+        return {"id": int(self.ids[row]), "url": self.url(row)}
+
+    def dequantize(self, rows=slice(None)):
+        """float32 gen_vectors of `rows`."""
+        vectors = np.asarray(self.vectors[rows], np.float32)
+        if self.scale is None:
+            return vectors
+        return vectors * self.scale + self.offset
+
+    @property
+    def bytes_per_video(self):
+        if not len(self):
+            return 0
+        arrays = (self.vectors, self.ids, self.order, self.url_offsets, self.url_blob)
+        return sum(a.nbytes for a in arrays) / len(self)
+
+
+class Slates:
+    """
+    Precomputed top rows per user key (see slates.py), valid only for the
+    model and catalog versions they were scored against.
+    """
+
+    def __init__(self, version, model_version, catalog_version, keys, rows):
+        self.version = version
+        self.model_version = model_version
+        self.catalog_version = catalog_version
+        self.keys = keys    # sorted uint64
+        self.rows = rows    # (len(keys), size) catalog rows, best first
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, key, model_version, catalog_version):
+        """Rows for `key`, or None when it has no slate or the slates are stale."""
+        if (model_version, catalog_version) != (self.model_version, self.catalog_version) or not len(self.keys):
+            return None
+        i = int(np.searchsorted(self.keys, np.uint64(key)))
+        if i == len(self.keys) or int(self.keys[i]) != key:
+            return None
+        return self.rows[i]
+
+
+class SharedState:
+    """
+    Global model weights and the catalog matrix as versioned, memory-mapped
+    files shared by every serving worker.
+
+    The aggregator publishes a new version by writing its files and then
+    atomically replacing current.json; readers check that pointer on each
+    call and remap only when it changed, so all workers see the same
+    arrays with no copies. Old versions are unlinked after KEEP_VERSIONS
+    publications (open maps stay valid until their readers drop them).
+    """
+
+    def __init__(self, root=STATE_DIR, keep=KEEP_VERSIONS):
+        self.root = root
+        self.keep = keep
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._pointer_stat = None
+        self._pointer = {}
+        self._model = None
+        self._catalog = None
+        self._slates = None
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    # -----------------------------
+    # Readers
+    # -----------------------------
+    def pointer(self):
+        path = self._path(POINTER)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return {}
+        key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if key != self._pointer_stat:
+            with open(path) as f:
+                self._pointer = json.load(f)
+            self._pointer_stat = key
+        return self._pointer
+
+    def model(self):
+        """(version, [weight arrays]) of the latest published model, or (None, None)."""
+        entry = self.pointer().get("model")
+        if entry is None:
+            return None, None
+        if self._model is None or self._model[0] != entry["version"]:
+            flat = np.memmap(self._path(f"model-{entry['version']}.f32"), dtype=np.float32, mode="r")
+            weights, offset = [], 0
+            for shape in entry["shapes"]:
+                size = int(np.prod(shape))
+                weights.append(flat[offset:offset + size].reshape(shape))
+                offset += size
+            self._model = (entry["version"], weights)
+        return self._model
+
+    def catalog(self):
+        """Latest published Catalog, or None."""
+        entry = self.pointer().get("catalog")
+        if entry is None or "dtype" not in entry:
+            return None  # nothing yet, or a snapshot in the pre-quantization layout (republished at startup)
+        if self._catalog is None or self._catalog.version != entry["version"]:
+            version = entry["version"]
+            dtype = entry.get("dtype", "float32")
+            vectors = (np.memmap(self._path(f"catalog-{version}.{dtype}"), dtype=DTYPES[dtype], mode="r",
+                                 shape=(entry["rows"], entry["dim"]))
+                       if entry["rows"] else np.empty((0, entry["dim"]), DTYPES[dtype]))
+            arrays = {part: np.load(self._path(f"catalog-{version}.{part}.npy"), mmap_mode="r")
+                      for part in ("ids", "order", "url_offsets")}
+            url_blob = (np.memmap(self._path(f"catalog-{version}.urls"), dtype=np.uint8, mode="r")
+                        if arrays["url_offsets"][-1] else np.empty(0, np.uint8))
+            scale, offset = entry.get("scale"), entry.get("offset")
+            self._catalog = Catalog(version, arrays["ids"], vectors, url_blob, arrays["url_offsets"],
+                                    order=arrays["order"],
+                                    scale=None if scale is None else np.array(scale, np.float32),
+                                    offset=None if offset is None else np.array(offset, np.float32))
+        return self._catalog
+
+    def slates(self):
+        """Latest published Slates, or None."""
+        entry = self.pointer().get("slates")
+        if entry is None:
+            return None
+        if self._slates is None or self._slates.version != entry["version"]:
+            version = entry["version"]
+            self._slates = Slates(version, entry["model"], entry["catalog"],
+                                  np.load(self._path(f"slates-{version}.keys.npy"), mmap_mode="r"),
+                                  np.load(self._path(f"slates-{version}.rows.npy"), mmap_mode="r"))
+        return self._slates
+
+    # -----------------------------
+    # Writer (aggregator process only)
+    # -----------------------------
+    def _swap_pointer(self, key, entry):
+        pointer = dict(self.pointer())
+        pointer[key] = entry
+        tmp = self._path(POINTER + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(pointer, f)
+        os.replace(tmp, self._path(POINTER))
+        self._prune(key, entry["version"])
+
+    def _prune(self, key, version):
+        stale = version - self.keep
+        for name in os.listdir(self.root):
+            if name.startswith(f"{key}-"):
+                try:
+                    if int(name[len(key) + 1:].split(".")[0]) <= stale:
+                        os.remove(self._path(name))
+                except (ValueError, FileNotFoundError):
+                    continue
+
+    def _next_version(self, key):
+        return self.pointer().get(key, {}).get("version", 0) + 1
+
+    def publish_model(self, weights):
+        """Write weights as the next model version and swap it in. Returns the version."""
+        with self.lock:
+            version = self._next_version("model")
+            weights = [np.asarray(w, np.float32) for w in weights]
+            tmp = self._path(f"model-{version}.f32.tmp")
+            with open(tmp, "wb") as f:
+                for w in weights:
+                    np.ascontiguousarray(w).tofile(f)
+            os.replace(tmp, self._path(f"model-{version}.f32"))
+            self._swap_pointer("model", {"version": version, "shapes": [list(w.shape) for w in weights]})
+            return version
+
+    def publish_catalog(self, ids, vectors, urls, dim=16, dtype=CATALOG_DTYPE):
+        """Write a catalog snapshot (vectors stored as `dtype`) as the next version and swap it in. Returns the version."""
+        stored, scale, offset = quantize(np.asarray(vectors, np.float32).reshape(len(ids), dim), dtype)
+        ids = np.asarray(ids, np.int64)
+        encoded = [u.encode() for u in urls]
+        url_offsets = np.zeros(len(encoded) + 1, np.int64)
+        np.cumsum([len(u) for u in encoded], out=url_offsets[1:])
+        with self.lock:
+            version = self._next_version("catalog")
+            tmp = self._path(f"catalog-{version}.{dtype}.tmp")
+            stored.tofile(tmp)
+            os.replace(tmp, self._path(f"catalog-{version}.{dtype}"))
+            np.save(self._path(f"catalog-{version}.ids.npy"), ids)
+            np.save(self._path(f"catalog-{version}.order.npy"), np.argsort(ids, kind="stable"))
+            np.save(self._path(f"catalog-{version}.url_offsets.npy"), url_offsets)
+            with open(self._path(f"catalog-{version}.urls"), "wb") as f:
+                f.write(b"".join(encoded))
+            entry = {"version": version, "rows": len(ids), "dim": dim, "dtype": dtype}
+            if scale is not None:
+                entry.update(scale=scale.tolist(), offset=offset.tolist())
+            self._swap_pointer("catalog", entry)
+            return version
+
+    def publish_slates(self, keys, rows, model_version, catalog_version):
+        """Write per-user slates scored against the given versions and swap them in. Returns the version."""
+        keys = np.asarray(keys, np.uint64)
+        order = np.argsort(keys, kind="stable")
+        with self.lock:
+            version = self._next_version("slates")
+            np.save(self._path(f"slates-{version}.keys.npy"), keys[order])
+            np.save(self._path(f"slates-{version}.rows.npy"), np.asarray(rows, np.int64)[order])
+            self._swap_pointer("slates", {"version": version, "model": model_version,
+                                          "catalog": catalog_version, "users": len(keys)})
+            return version
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+from metrics import registry
+from scoring import batch_top_k, fold_dequantization
+
+SLATE_SIZE = 100               # rows kept per user; covers top_k plus what the seen filter removes
+SLATE_USERS = int(os.environ.get("SLATE_USERS", "5000"))  # most recently active vectors rebuilt
+SLATE_BATCH = 16               # users scored together per catalog pass
+SLATE_BUILD_SECONDS = 120      # build budget; users past it fall back to live scoring
+SLATE_MIN_INTERVAL = 10        # seconds between builds triggered by new users
+
+slate_build_seconds = registry.histogram("slate_build_seconds", "Time to rebuild all slates",
+                                         buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300))
+slate_users = registry.gauge("slate_users", "Users with a precomputed slate")
+
+
+def slate_key(user_vec):
+    """Stable 64-bit key of a user vector (exact float32 bytes, as /recommend receives it)."""
+    digest = hashlib.blake2b(np.asarray(user_vec, np.float32).tobytes(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class SlateBuilder:
+    """
+    Rebuilds per-user slates on a background thread in the aggregator
+    process. trigger() is called when a model or catalog version is
+    published and when new users show up; triggers during a build coalesce
+    into one more build. A build scores the vectors from `users()` (most
+    recently active first) against the published model and catalog in
+    batches, stopping at the time budget, and publishes the top SLATE_SIZE
+    rows of each to `state` tagged with the versions used, so workers never
+    serve a slate from an older model or catalog.
+    """
+
+    def __init__(self, state, users, size=SLATE_SIZE, batch=SLATE_BATCH, budget=SLATE_BUILD_SECONDS,
+                 min_interval=SLATE_MIN_INTERVAL):
+        self.state = state
+        self.users = users
+        self.size = size
+        self.batch = batch
+        self.budget = budget
+        self.min_interval = min_interval
+        self.wake = threading.Event()
+        self.last_build = 0.0
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def trigger(self):
+        self.wake.set()
+
+    def _loop(self):
+        while True:
+            self.wake.wait()
+            time.sleep(max(0.0, self.last_build + self.min_interval - time.monotonic()))
+            self.wake.clear()
+            try:
+                self.build()
+            except Exception as e:
+                print(f"⚠️ Slate build failed: {e}")
+            self.last_build = time.monotonic()
+
+    def build(self):
+        model_version, weights = self.state.model()
+        catalog = self.state.catalog()
+        vectors = self.users()
+        if weights is None or catalog is None or not len(catalog) or not vectors:
+            return None
+        start = time.perf_counter()
+        weights = fold_dequantization(weights, catalog.scale, catalog.offset)
+        vectors = np.asarray(vectors, np.float32)
+        keys, rows = [], []
+        for i in range(0, len(vectors), self.batch):
+            chunk = vectors[i:i + self.batch]
+            rows.append(batch_top_k(weights, chunk, catalog.vectors, self.size))
+            keys.extend(slate_key(v) for v in chunk)
+            if time.perf_counter() - start > self.budget:
+                break
+        rows = np.vstack(rows)
+        version = self.state.publish_slates(keys, rows, model_version, catalog.version)
+        slate_build_seconds.observe(time.perf_counter() - start)
+        slate_users.set(len(keys))
+        return version
@@ -0,0 +1,167 @@
+import json
+import os
+import sys
+import numpy as np
+from interaction_store import iter_chunks, csv_file, CHUNK_ROWS
+from utils import ClientShard
+
+feat_dir = "data/features"            # one {pid}.npy embedding file per video
+video_store_dir = "data/video_store"
+shard_dir = "data/client_shards"
+
+WATCH_THRESHOLD = 3   # watch_time >= threshold -> positive label
+NUM_BUCKETS = 64      # user hash partitions written while streaming
+
+SHARD_COLUMNS = {"pid": np.int64, "user_id": np.int64, "watch_time": np.int32}
+
+
+def build_video_store(features=feat_dir, out_dir=video_store_dir):
+    """
+    Stack the per-pid feature files into one float32 matrix sorted by pid,
+    so pids can be joined with a searchsorted instead of a dict or file open.
+    Multi-frame features are mean-pooled, like get_video_embedding does.
+    """
+    files = [f for f in os.listdir(features) if f.endswith(".npy") and f[:-4].isdigit()]
+    pids = np.array(sorted(int(f[:-4]) for f in files), dtype=np.int64)
+    if len(pids) == 0:
+        raise ValueError(f"No {{pid}}.npy files found in {features}")
+
+    def vector(pid):
+        v = np.load(os.path.join(features, f"{pid}.npy"))
+        return v.reshape(-1, v.shape[-1]).mean(axis=0) if v.ndim > 1 else v
+
+    dim = vector(pids[0]).shape[0]
+    os.makedirs(out_dir, exist_ok=True)
+    out = np.lib.format.open_memmap(os.path.join(out_dir, "embeddings.npy"), mode='w+', dtype=np.float32, shape=(len(pids), dim))
+    for row, pid in enumerate(pids):
+        out[row] = vector(pid)
+    out.flush()
+    del out
+    np.save(os.path.join(out_dir, "pids.npy"), pids)
+    return len(pids), dim
+
+
+def load_video_store(path=video_store_dir):
+    return np.load(os.path.join(path, "pids.npy")), np.load(os.path.join(path, "embeddings.npy"), mmap_mode='r')
+
+
+def build_client_shards(csv_path=csv_file, video_store=video_store_dir, out_dir=shard_dir,
+                        watch_threshold=WATCH_THRESHOLD, num_buckets=NUM_BUCKETS, chunk_rows=CHUNK_ROWS):
+    """
+    Turn the interaction log into per-user training shards in one streaming pass.
+
+    Each chunk is joined to the video store (pid -> embedding row), labelled by
+    watch_time, and appended to one of num_buckets files by user hash. Buckets
+    are then sorted one at a time, so peak memory is max(chunk, bucket) rather
+    than the whole log. Output is flat columns grouped by user:
+
+        users.npy    sorted user ids
+        spans.npy    user i owns interactions spans[i, 0]:spans[i, 1]
+        rows.npy     row in the video store's embeddings.npy
+        labels.npy   1 if watch_time >= watch_threshold else 0
+    """
+    pids, _ = load_video_store(video_store)
+    os.makedirs(out_dir, exist_ok=True)
+    bucket_paths = [os.path.join(out_dir, f"bucket_{b}.bin") for b in range(num_buckets)]
+    record = np.dtype([("user_id", np.int64), ("row", np.int32), ("label", np.int8)])
+
+    total, dropped = 0, 0
+    bucket_files = [open(p, "wb") for p in bucket_paths]
+    try:
+        for chunk in iter_chunks(csv_path, SHARD_COLUMNS, chunk_rows):
+            # join pid -> embedding row, dropping videos we have no embedding for
+            pos = np.searchsorted(pids, chunk["pid"])
+            pos = np.minimum(pos, len(pids) - 1)
+            known = pids[pos] == chunk["pid"]
+            dropped += int((~known).sum())
+
+            recs = np.empty(int(known.sum()), dtype=record)
+            recs["user_id"] = chunk["user_id"][known]
+            recs["row"] = pos[known]
+            recs["label"] = chunk["watch_time"][known] >= watch_threshold
+            total += len(recs)
+
+            buckets = recs["user_id"] % num_buckets
+            order = np.argsort(buckets, kind='stable')
+            bounds = np.searchsorted(buckets[order], np.arange(num_buckets + 1))
+            for b in range(num_buckets):
+                if bounds[b] < bounds[b + 1]:
+                    recs[order[bounds[b]:bounds[b + 1]]].tofile(bucket_files[b])
+    finally:
+        for f in bucket_files:
+            f.close()
+
+    rows_out = np.lib.format.open_memmap(os.path.join(out_dir, "rows.npy"), mode='w+', dtype=np.int32, shape=(total,))
+    labels_out = np.lib.format.open_memmap(os.path.join(out_dir, "labels.npy"), mode='w+', dtype=np.int8, shape=(total,))
+    users, counts = [], []
+    start = 0
+    for path in bucket_paths:
+        recs = np.fromfile(path, dtype=record)
+        os.remove(path)
+        if len(recs) == 0:
+            continue
+        recs = recs[np.argsort(recs["user_id"], kind='stable')]
+        rows_out[start:start + len(recs)] = recs["row"]
+        labels_out[start:start + len(recs)] = recs["label"]
+        bucket_users, bucket_counts = np.unique(recs["user_id"], return_counts=True)
+        users.append(bucket_users)
+        counts.append(bucket_counts)
+        start += len(recs)
+    rows_out.flush()
+    labels_out.flush()
+    del rows_out, labels_out
+
+    # interactions are laid out in bucket order, so store a (start, end) span per sorted user
+    users = np.concatenate(users) if users else np.empty(0, np.int64)
+    counts = np.concatenate(counts) if counts else np.empty(0, np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    order = np.argsort(users)
+    np.save(os.path.join(out_dir, "users.npy"), users[order])
+    np.save(os.path.join(out_dir, "spans.npy"), np.stack([offsets[:-1][order], offsets[1:][order]], axis=1))
+
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump({"video_store": os.path.abspath(video_store), "watch_threshold": watch_threshold,
+                   "interactions": total, "dropped": dropped, "users": len(users)}, f)
+    return total, dropped
+
+
+def load_client_shards(path=shard_dir, user_dim=64, users=None, min_samples=1, initial='user', seed=None):
+    """
+    Memory-map the shards written by build_client_shards and return
+    {client name: ClientShard}, the same shape create_clients returns.
+    Nothing is read from disk until a client's dataset is iterated.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    _, embeddings = load_video_store(meta["video_store"])
+    all_users = np.load(os.path.join(path, "users.npy"))
+    spans = np.load(os.path.join(path, "spans.npy"))
+    rows = np.load(os.path.join(path, "rows.npy"), mmap_mode='r')
+    labels = np.load(os.path.join(path, "labels.npy"), mmap_mode='r')
+
+    if users is not None:
+        users = np.asarray(users, dtype=np.int64)
+        pos = np.searchsorted(all_users, users)
+        keep = (pos < len(all_users)) & (all_users[np.minimum(pos, len(all_users) - 1)] == users)
+        selected = pos[keep]
+    else:
+        selected = np.arange(len(all_users))
+
+    rng = np.random.default_rng(seed)
+    clients = {}
+    for i in selected:
+        start, end = spans[i]
+        if end - start < min_samples:
+            continue
+        user_embedding = rng.random((1, user_dim), dtype=np.float32)
+        clients[f"{initial}_{all_users[i]}"] = ClientShard(embeddings, labels, np.arange(start, end), user_embedding, rows=rows)
+    return clients
+
+
+if __name__ == "__main__":
+    src = sys.argv[1] if len(sys.argv) > 1 else csv_file
+    if not os.path.exists(os.path.join(video_store_dir, "pids.npy")):
+        num_videos, dim = build_video_store()
+        print(f"Stacked {num_videos} video embeddings ({dim}-d) into {video_store_dir}")
+    total, dropped = build_client_shards(src)
+    print(f"Wrote {total} labelled interactions to {shard_dir} ({dropped} without an embedding dropped)")
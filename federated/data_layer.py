@@ -1,52 +1,70 @@
-import random
+import os
 import numpy as np
 import tensorflow as tf
 from sklearn.model_selection import train_test_split
-from mock_api import load_from_db
-from utils import reshape_embeddings
+from mock_api import load_from_db, load_from_store, embedding_dir
+from utils import reshape_embeddings, create_clients
 
-def load(test_size=0.1):
+EMBEDDINGS_FILE = "embeddings.npy"
+LABELS_FILE = "labels.npy"
+
+def build_embedding_store(store_dir=embedding_dir):
     """
-    Load vector embeddings and labels, flatten embeddings, 
-    convert labels to binary (1 if <=5 else 0), and split into train/test sets.
+    One-time conversion of the JSON embeddings into float32 .npy files
+    that can be memory-mapped by every later run.
+    """
+    X, y = load_from_db()
+    X = reshape_embeddings(X).astype(np.float32)
+    y = y.astype(np.int8)
+
+    # write to temp files first so an interrupted run never leaves a half store
+    for name, arr in ((EMBEDDINGS_FILE, X), (LABELS_FILE, y)):
+        path = os.path.join(store_dir, name)
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, arr)
+        os.replace(tmp_path, path)
+    return X.shape
+
+def load_embedding_store(store_dir=embedding_dir):
     """
+    Memory-map the embedding store, building it first if it doesn't exist yet.
+    The CLIP store written by the videovector pipeline is used directly when present.
+    Returns (X, y, indices) where indices are the usable rows of X and y.
+    """
+    from_store = load_from_store()
+    if from_store is not None:
+        return from_store
 
-    X, y =  load_from_db()
-    X = reshape_embeddings(X)
+    emb_path = os.path.join(store_dir, EMBEDDINGS_FILE)
+    labels_path = os.path.join(store_dir, LABELS_FILE)
+    if not (os.path.exists(emb_path) and os.path.exists(labels_path)):
+        build_embedding_store(store_dir)
+    X = np.load(emb_path, mmap_mode='r')
+    y = np.load(labels_path, mmap_mode='r')
+    return X, y, np.arange(len(y))
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
-    return X_train, X_test, y_train, y_test
+def load_indices(test_size=0.1):
+    """
+    Memory-mapped embeddings and labels plus train/test index arrays.
+    Use this when sharding, so no rows are copied.
+    """
+    X, y, indices = load_embedding_store()
+    train_idx, test_idx = train_test_split(indices, test_size=test_size, random_state=42)
+    return X, y, train_idx, test_idx
 
-def create_clients(embeddings, labels, num_clients=2, user_dim=64, initial='client'):
+def load(test_size=0.1):
     """
-    split training data into 'num_clients', 
-    adds random user embedding to each shard,
-    return a dictionary mapping client names to their data
+    Load vector embeddings and labels, flatten embeddings,
+    convert labels to binary (1 if <=5 else 0), and split into train/test sets.
     """
 
-    client_names = [f"{initial}_{i+1}" for i in range(num_clients)]
-    data = list(zip(embeddings, labels))
-    random.shuffle(data)
-    size = len(data) // num_clients
-    shards = [data[i:i+size] for i in range(0, size*num_clients, size)]
-    
-    clients = {}
-    for i, shard in enumerate(shards):
-        videos, y = zip(*shard)
-        videos = np.array(videos)
-        y = np.array(y)
-        
-        user_embedding = np.random.rand(1, user_dim).astype(np.float32)
-        user_embedding_tile = np.tile(user_embedding, (videos.shape[0], 1))
-        
-        X_concat = np.concatenate([videos, user_embedding_tile], axis=1)
-        clients[client_names[i]] = list(zip(X_concat, y))
-    return clients
+    X, y, train_idx, test_idx = load_indices(test_size)
+    return X[train_idx], X[test_idx], y[train_idx], y[test_idx]
 
 def prepare_test_set(X_test, y_test, user_dim=64):
+    X_test = np.asarray(X_test, dtype=np.float32)
     user_embedding_test = np.random.rand(1, user_dim).astype(np.float32)
-    user_embedding_test_tile = np.tile(user_embedding_test, (X_test.shape[0], 1))
+    user_embedding_test_tile = np.broadcast_to(user_embedding_test, (X_test.shape[0], user_dim))
     X_test_concat = np.concatenate([X_test, user_embedding_test_tile], axis=1)
     test_dataset = tf.data.Dataset.from_tensor_slices((X_test_concat, y_test)).batch(len(y_test))
     return test_dataset
-
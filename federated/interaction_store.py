@@ -0,0 +1,161 @@
+import csv
+import os
+import sys
+from contextlib import ExitStack
+import numpy as np
+
+csv.field_size_limit(sys.maxsize)
+
+csv_file = "data/interaction_filtered.csv"
+store_dir = "data/interaction_store"
+
+# column name -> dtype stored on disk
+COLUMNS = {
+    "user_id": np.int64,
+    "pid": np.int64,
+    "category_id": np.int64,
+    "watch_time": np.int32,
+}
+INDEXED_COLUMNS = ("user_id", "category_id")
+CHUNK_ROWS = 1_000_000
+
+
+def _column_path(store, name):
+    return os.path.join(store, f"{name}.npy")
+
+
+def iter_chunks(csv_path=csv_file, columns=COLUMNS, chunk_rows=CHUNK_ROWS):
+    """
+    Stream the interaction CSV as {column: np.ndarray} chunks of at most
+    chunk_rows rows, so callers never hold more than one chunk in memory.
+    """
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None or not set(columns).issubset(header):
+            raise ValueError(f"CSV must contain {', '.join(columns)} columns")
+        positions = {name: header.index(name) for name in columns}
+        buffers = {name: [] for name in columns}
+        buffered = 0
+
+        for row in reader:
+            for name, pos in positions.items():
+                buffers[name].append(int(row[pos]))
+            buffered += 1
+            if buffered == chunk_rows:
+                yield {n: np.asarray(v, dtype=columns[n]) for n, v in buffers.items()}
+                buffers = {n: [] for n in columns}
+                buffered = 0
+        if buffered:
+            yield {n: np.asarray(v, dtype=columns[n]) for n, v in buffers.items()}
+
+
+def _build_index(store, name):
+    """
+    Sort order plus offsets for one column: rows with key keys[i] are
+    order[offsets[i]:offsets[i+1]].
+    """
+    col = np.load(_column_path(store, name), mmap_mode='r')
+    order = np.argsort(col, kind='stable')
+    sorted_col = col[order]
+    keys, starts = np.unique(sorted_col, return_index=True)
+    offsets = np.append(starts, len(col)).astype(np.int64)
+
+    np.save(os.path.join(store, f"{name}_order.npy"), order.astype(np.int64))
+    np.save(os.path.join(store, f"{name}_keys.npy"), keys)
+    np.save(os.path.join(store, f"{name}_offsets.npy"), offsets)
+    return len(keys)
+
+
+def build_interaction_store(csv_path=csv_file, out_dir=store_dir, chunk_rows=CHUNK_ROWS):
+    """
+    One-time streaming conversion of the interaction CSV into .npy columns
+    with per-user and per-category offset indexes. Memory stays bounded by
+    chunk_rows while reading; only the index sort touches a full column.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    raw_paths = {name: os.path.join(out_dir, f"{name}.bin") for name in COLUMNS}
+    num_rows = 0
+
+    with ExitStack() as stack:
+        raw_files = {name: stack.enter_context(open(path, "wb")) for name, path in raw_paths.items()}
+        for chunk in iter_chunks(csv_path, COLUMNS, chunk_rows):
+            for name, values in chunk.items():
+                values.tofile(raw_files[name])
+            num_rows += len(chunk["pid"])
+
+    # raw dumps -> .npy (copied in chunks so the header can be written up front)
+    for name, dtype in COLUMNS.items():
+        raw = np.memmap(raw_paths[name], dtype=dtype, mode='r', shape=(num_rows,)) if num_rows else np.empty(0, dtype)
+        out = np.lib.format.open_memmap(_column_path(out_dir, name), mode='w+', dtype=dtype, shape=(num_rows,))
+        for start in range(0, num_rows, chunk_rows):
+            out[start:start + chunk_rows] = raw[start:start + chunk_rows]
+        out.flush()
+        del raw, out
+        os.remove(raw_paths[name])
+
+    for name in INDEXED_COLUMNS:
+        _build_index(out_dir, name)
+
+    return num_rows
+
+
+class InteractionStore:
+    """Memory-mapped, read-only view over a store built by build_interaction_store."""
+
+    def __init__(self, path=store_dir):
+        self.path = path
+        self.columns = {name: np.load(_column_path(path, name), mmap_mode='r') for name in COLUMNS}
+        self.indexes = {}
+        for name in INDEXED_COLUMNS:
+            self.indexes[name] = (
+                np.load(os.path.join(path, f"{name}_keys.npy")),
+                np.load(os.path.join(path, f"{name}_offsets.npy")),
+                np.load(os.path.join(path, f"{name}_order.npy"), mmap_mode='r'),
+            )
+
+    def __len__(self):
+        return len(self.columns["pid"])
+
+    def keys(self, key):
+        return self.indexes[key][0]
+
+    def rows(self, key, ids):
+        """
+        Row numbers for each requested id, as {id: sorted row array}.
+        Unknown ids map to an empty array.
+        """
+        keys, offsets, order = self.indexes[key]
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        if len(keys) == 0:
+            return {i: np.empty(0, dtype=np.int64) for i in ids.tolist()}
+
+        pos = np.searchsorted(keys, ids)
+        found = (pos < len(keys)) & (keys[np.minimum(pos, len(keys) - 1)] == ids)
+
+        result = {}
+        for i, p, hit in zip(ids.tolist(), pos.tolist(), found.tolist()):
+            if hit:
+                result[i] = np.sort(order[offsets[p]:offsets[p + 1]])
+            else:
+                result[i] = np.empty(0, dtype=np.int64)
+        return result
+
+    def column(self, name, rows):
+        return self.columns[name][rows]
+
+
+def open_store(path=store_dir, csv_path=csv_file):
+    """Open the store, running the one-time indexer first if needed."""
+    if not os.path.exists(os.path.join(path, "category_id_offsets.npy")):
+        print(f"Building interaction store from {csv_path} ...")
+        rows = build_interaction_store(csv_path, path)
+        print(f"Indexed {rows} interactions into {path}")
+    return InteractionStore(path)
+
+
+if __name__ == "__main__":
+    src = sys.argv[1] if len(sys.argv) > 1 else csv_file
+    dst = sys.argv[2] if len(sys.argv) > 2 else store_dir
+    rows = build_interaction_store(src, dst)
+    print(f"Indexed {rows} interactions into {dst}")
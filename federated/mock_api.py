@@ -12,6 +12,52 @@ import tensorflow as tf
 from sklearn.metrics import accuracy_score
 
 embedding_dir = '/Users/luciusyeojunjie/Desktop/TikTokTechJam2025/federated/data'
+clip_store_dir = embedding_dir + "/store"   # copy of videovector's embeddings/store
+clip_model = os.environ.get("CLIP_MODEL")     # e.g. "ViT-B/32-int8"; None: whichever model wrote last
+
+def store_model_dir(store_dir=clip_store_dir, model_name=None):
+    """
+    Directory of the video table for `model_name` (named like videovector's
+    embedding_store.model_dir_name, e.g. "ViT-B/32-int8" -> "ViT-B_32-int8"),
+    or with no model name the most recently written one. None if missing.
+    """
+    videos = os.path.join(store_dir, "videos")
+    if model_name is not None:
+        table = os.path.join(videos, model_name.replace("/", "_"))
+        return table if os.path.exists(os.path.join(table, "meta.json")) else None
+    if not os.path.isdir(videos):
+        return None
+    tables = [os.path.join(videos, d) for d in os.listdir(videos)
+              if os.path.exists(os.path.join(videos, d, "meta.json"))]
+    return max(tables, key=lambda t: os.path.getmtime(os.path.join(t, "vectors.f32")), default=None)
+
+def load_from_store(store_dir=clip_store_dir, model_name=clip_model):
+    """
+    Memory-map the per-video vectors written by videovector's EmbeddingStore
+    for `model_name` (by default the CLIP_MODEL environment variable).
+    Returns (X, y, indices): X and y cover every stored row (y follows
+    load_from_db: 1 for animals, 0 otherwise) and indices are the rows to
+    use, the latest one per video, so nothing is copied out of the memmap.
+    Returns None if there is no store.
+    """
+    table = store_model_dir(store_dir, model_name)
+    if table is None:
+        return None
+    with open(os.path.join(table, "meta.json")) as f:
+        dim = json.load(f)["dim"]
+    rows = os.path.getsize(os.path.join(table, "vectors.f32")) // (4 * dim)
+    with open(os.path.join(table, "keys.tsv")) as f:
+        keys = [line.split("\t") for line in f.read().splitlines()[:rows]]
+
+    # the store is append-only: keep the latest row per video
+    latest = {}
+    for row, key in enumerate(keys):
+        latest[key[0]] = row
+    selected = np.array(sorted(latest.values()), dtype=np.int64)
+
+    X = np.memmap(os.path.join(table, "vectors.f32"), dtype=np.float32, mode='r', shape=(rows, dim))
+    y = np.array([1 if key[1] == "animals" else 0 for key in keys], dtype=np.int8)
+    return X, y, selected
 
 def load_from_db():
     with open(embedding_dir+"/animals.json", 'r') as f:
@@ -1,33 +1,26 @@
-import csv
-from collections import defaultdict
+import argparse
+import os
 import sys
+import numpy as np
 
-csv.field_size_limit(sys.maxsize)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from interaction_store import open_store
 
-# ---- Specify user_id here ----
-target_user = "1765"   # replace with actual user_id you want to inspect
+# ---- Specify user_id(s) on the command line, e.g. `python scripts/fetch_user_videos.py 1765 42` ----
+parser = argparse.ArgumentParser(description="Videos watched per user, from the indexed interaction store")
+parser.add_argument("user_ids", nargs="*", default=["1765"])
+parser.add_argument("--csv", default="data/interaction_filtered.csv")  # only read if the store is missing
+parser.add_argument("--store", default="data/interaction_store")
+parser.add_argument("--min-watch", type=int, default=3)
+args = parser.parse_args()
 
-# Path to your CSV file
-csv_file = "data/interaction_filtered.csv"  # replace with your CSV path
+store = open_store(args.store, args.csv)
+rows_per_user = store.rows("user_id", [int(u) for u in args.user_ids])
 
-# Dictionary to store unique videos per user
-user_videos = set()
-user_videos_effective = set()
+for user, rows in rows_per_user.items():
+    pids = store.column("pid", rows)
+    watch_time = store.column("watch_time", rows)
 
-# Read CSV line by line
-with open(csv_file, newline='', encoding='utf-8') as f:
-    reader = csv.DictReader(f)
-    
-    if reader.fieldnames is None or not {'user_id', 'pid'}.issubset(reader.fieldnames):
-        raise ValueError("CSV must contain 'user_id' and 'pid' columns")
-    
-    for row in reader:
-        if row['user_id'] == target_user:
-            user_videos.add(row['pid'])
-            if int(row['watch_time']) >= 3:
-                user_videos_effective.add(row['pid'])
-
-
-print("User:", target_user)
-print("Videos watched:", len(user_videos))
-print("Effective videos (watch_time >= 3):", len(user_videos_effective))
+    print("User:", user)
+    print("Videos watched:", len(np.unique(pids)))
+    print(f"Effective videos (watch_time >= {args.min_watch}):", len(np.unique(pids[watch_time >= args.min_watch])))
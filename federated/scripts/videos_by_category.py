@@ -1,28 +1,34 @@
-import csv
+import argparse
+import os
 import sys
+import numpy as np
 
-csv.field_size_limit(sys.maxsize)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from interaction_store import open_store
 
-csv_file = "data/interaction_filtered.csv"  # replace with your CSV path
-output_file = "data/category_videos.txt"
+# ---- Specify category_id(s) on the command line, e.g. `python scripts/videos_by_category.py 1168 1170` ----
+parser = argparse.ArgumentParser(description="Unique videos per category, from the indexed interaction store")
+parser.add_argument("category_ids", nargs="*", default=["1168"])
+parser.add_argument("--csv", default="data/interaction_filtered.csv")  # only read if the store is missing
+parser.add_argument("--store", default="data/interaction_store")
+parser.add_argument("--output", default="data/category_videos.txt")
+args = parser.parse_args()
 
-target_category = "1168"  # <-- change this to any category_id
+store = open_store(args.store, args.csv)
+rows_per_category = store.rows("category_id", [int(c) for c in args.category_ids])
 
-unique_videos = set()
-
-with open(csv_file, newline='', encoding='utf-8') as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        if row['category_id'] == target_category:
-            unique_videos.add(row['pid'])
+unique_videos = []
+for category, rows in rows_per_category.items():
+    pids = np.unique(store.column("pid", rows))
+    unique_videos.append(pids)
+    print(f"Category {category} has {len(pids)} unique videos")
+unique_videos = np.unique(np.concatenate(unique_videos)) if unique_videos else []
 
 # Convert to JS array format
-videos_list = list(unique_videos)
-js_array = "[\n  " + ",\n  ".join(f'"{vid}"' for vid in videos_list) + "\n]"
+js_array = "[\n  " + ",\n  ".join(f'"{vid}"' for vid in unique_videos) + "\n]"
 
 # Write to file
-with open(output_file, "w", encoding="utf-8") as f:
+with open(args.output, "w", encoding="utf-8") as f:
     f.write(js_array)
 
-print(f"Category {target_category} has {len(unique_videos)} unique videos")
-print(f"Saved list to {output_file}")
+print(f"Saved {len(unique_videos)} videos to {args.output}")
@@ -1,7 +1,7 @@
 import numpy as np
-from data_layer import create_clients, load, prepare_test_set
+from data_layer import create_clients, load, load_indices, prepare_test_set
 from trainer import federated_training, standard_sgd_training
-from utils import batch_data
+from utils import batch_clients
 from mock_local_env import local_trainer
 
 def get_global_weights():
@@ -24,23 +24,24 @@ def train_locally():
 
 
 if __name__ == "__main__":
-    X_train, X_test, y_train, y_test = load()
+    X, y, train_idx, test_idx = load_indices()
 
     num_clients = 2
     user_dim = 64
-    video_dim = X_train.shape[1] # gets embedding size
+    video_dim = X.shape[1] # gets embedding size
     input_dim = video_dim + user_dim
 
-    clients = create_clients(X_train, y_train, num_clients=num_clients, user_dim=user_dim)
-    clients_batched = {name: batch_data(data, bs=len(data)) for name, data in clients.items()}
-    test_batched = prepare_test_set(X_test, y_test, user_dim=user_dim)
+    # shards are index arrays into the memmapped store, datasets are built lazily
+    clients = create_clients(X, y, num_clients=num_clients, user_dim=user_dim, indices=train_idx)
+    clients_batched, client_counts = batch_clients(clients)
+    test_batched = prepare_test_set(X[test_idx], y[test_idx], user_dim=user_dim)
 
     print("Starting federated training...")
-    global_model = federated_training(clients_batched, test_batched, input_dim)
+    global_model = federated_training(clients_batched, test_batched, input_dim, client_counts)
     print("Federated training finished!")
 
     print("Starting standard SGD training...")
-    standard_sgd_model = standard_sgd_training(X_train, y_train, test_batched, input_dim)
+    standard_sgd_model = standard_sgd_training(X[train_idx], y[train_idx], test_batched, input_dim)
     print("Standard SGD training finished!")
 
 
@@ -55,11 +56,11 @@ if __name__ == "__main__":
     input_dim = video_dim + user_dim
 
     clients = create_clients(X_train, y_train, num_clients=num_clients, user_dim=user_dim)
-    clients_batched = {name: batch_data(data, bs=len(data)) for name, data in clients.items()}
+    clients_batched, client_counts = batch_clients(clients)
     test_batched = prepare_test_set(X_test, y_test, user_dim=user_dim)
 
     print("Starting federated training...")
-    global_model = federated_training(clients_batched, test_batched, input_dim)
+    global_model = federated_training(clients_batched, test_batched, input_dim, client_counts)
     print("Federated training finished!")
 
     print("Starting standard SGD training...")
@@ -6,7 +6,12 @@ from keras import backend as K
 from mlp_model import build_binary_mlp
 from utils import weight_scaling_factor, scale_model_weights, sum_scaled_weights, test_model
 
-def federated_training(clients_batched, test_batched, input_dim, comm_rounds=20, lr=0.01):
+def federated_training(clients_batched, test_batched, input_dim, client_counts, comm_rounds=20, lr=0.01):
+    """
+    FedAvg over clients_batched ({name: tf.data.Dataset}); client_counts
+    holds each client's sample count (utils.batch_clients returns both), so
+    no dataset is iterated just to size the scaling factors.
+    """
     global_model = build_binary_mlp(input_dim)
     global_model.compile(loss='binary_crossentropy', optimizer=SGD(learning_rate=lr, momentum=0.9), metrics=['accuracy'])
 
@@ -17,6 +22,10 @@ def federated_training(clients_batched, test_batched, input_dim, comm_rounds=20,
         model.compile(loss='binary_crossentropy', optimizer=SGD(learning_rate=lr, momentum=0.9), metrics=['accuracy'])
         client_models[client] = model
 
+    # Scaling factors only depend on shard sizes, so compute them once
+    global_count = sum(client_counts.values())
+    scaling_factors = {c: weight_scaling_factor(client_counts, c, global_count) for c in client_names}
+
     for comm_round in range(comm_rounds):
         global_weights = global_model.get_weights()
         scaled_local_weight_list = []
@@ -30,8 +39,7 @@ def federated_training(clients_batched, test_batched, input_dim, comm_rounds=20,
             local_model.fit(clients_batched[client], epochs=1, verbose=0)
 
             # Scale and store weights
-            scaling_factor = weight_scaling_factor(clients_batched, client)
-            scaled_weights = scale_model_weights(local_model.get_weights(), scaling_factor)
+            scaled_weights = scale_model_weights(local_model.get_weights(), scaling_factors[client])
             scaled_local_weight_list.append(scaled_weights)
 
         # Aggregate global weights
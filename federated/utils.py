@@ -2,8 +2,8 @@ import keras
 import torch
 from torchvision.io import read_video
 from torchvision.transforms import Compose, Resize, ToTensor, Normalize
+import os
 import numpy as np
-import random
 import tensorflow as tf
 from sklearn.metrics import accuracy_score
 
@@ -18,47 +18,118 @@ def reshape_embeddings(X, flatten=True):
     return reshaped_X
 
 
-def create_clients(video_embeddings, labels, num_clients=3, user_dim=64, initial='client'):
-    """Splits dataset into clients and attaches random user embeddings."""
+class ClientShard:
+    """
+    One client's view of the training data: an index array into the shared
+    (memory-mapped) embedding matrix plus the client's user embedding.
+    Nothing is copied until the tf.data pipeline gathers a batch.
+
+    If `rows` is given, indices address `labels`/`rows` (e.g. one user's
+    interactions) and rows[idx] gives the embedding row for each sample.
+    """
+    def __init__(self, embeddings, labels, indices, user_embedding, rows=None):
+        self.embeddings = embeddings
+        self.labels = labels
+        self.indices = indices
+        self.user_embedding = user_embedding
+        self.rows = rows
+        self.num_samples = len(indices)
+
+    def _gather(self, idx):
+        # sorted reads are sequential on the memmap; order inside a batch doesn't matter
+        idx = np.sort(idx)
+        emb_idx = idx if self.rows is None else np.asarray(self.rows[idx])
+        videos = np.asarray(self.embeddings[emb_idx], dtype=np.float32)
+        users = np.broadcast_to(self.user_embedding, (len(idx), self.user_embedding.shape[1]))
+        X = np.concatenate([videos, users], axis=1)
+        y = np.asarray(self.labels[idx], dtype=np.float32)
+        return X, y
+
+    def dataset(self, bs=32, shuffle=True):
+        """Build the client's tf.data.Dataset on demand."""
+        input_dim = self.embeddings.shape[1] + self.user_embedding.shape[1]
+        ds = tf.data.Dataset.from_tensor_slices(self.indices)
+        if shuffle:
+            ds = ds.shuffle(self.num_samples)
+        ds = ds.batch(bs)
+
+        def gather(idx):
+            X, y = tf.numpy_function(self._gather, [idx], (tf.float32, tf.float32))
+            X.set_shape([None, input_dim])
+            y.set_shape([None])
+            return X, y
+
+        return ds.map(gather, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def create_clients(video_embeddings, labels, num_clients=3, user_dim=64, initial='client', indices=None, seed=None,
+                   shards=None):
+    """
+    Splits dataset into clients and attaches random user embeddings.
+
+    Shards are index arrays into `video_embeddings` (which can be a memmap),
+    so setup cost is one permutation regardless of embedding size.
+
+    With `shards` (a directory written by client_shards.build_client_shards)
+    the clients are the first num_clients users of the interaction log
+    instead, each with their own labelled interactions over the video store;
+    video_embeddings, labels and indices are then unused. User embeddings
+    are random either way: the log carries no user features.
+    """
+    if shards is not None:
+        from client_shards import load_client_shards  # client_shards imports this module
+        users = np.load(os.path.join(shards, "users.npy"), mmap_mode='r')[:num_clients]
+        return load_client_shards(shards, user_dim=user_dim, users=users, initial=initial, seed=seed)
+
     client_names = [f"{initial}_{i+1}" for i in range(num_clients)]
-    
-    # Shuffle data
-    data = list(zip(video_embeddings, labels))
-    random.shuffle(data)
-    
-    # Shard data
-    size = len(data) // num_clients
-    shards = [data[i:i+size] for i in range(0, size*num_clients, size)]
-    
+    rng = np.random.default_rng(seed)
+
+    # Shuffle indices instead of the data itself
+    if indices is None:
+        indices = np.arange(len(labels))
+    order = rng.permutation(np.asarray(indices))
+
+    # Shard data (remainder is dropped, as before)
+    size = len(order) // num_clients
+    shards = order[:size * num_clients].reshape(num_clients, size) if size else []
+
     clients = {}
     for i, shard in enumerate(shards):
-        videos, y = zip(*shard)
-        videos = np.array(videos)
-        y = np.array(y)
-        
-        # Create random user embedding for this client
-        user_embedding = np.random.rand(1, user_dim).astype(np.float32)
-        user_embedding_tile = np.tile(user_embedding, (videos.shape[0], 1))
-        
-        # Concatenate user embedding to video embeddings
-        X_concat = np.concatenate([videos, user_embedding_tile], axis=1)
-        
-        clients[client_names[i]] = list(zip(X_concat, y))
-        
+        # One user embedding per client, broadcast per batch instead of tiled per row
+        user_embedding = rng.random((1, user_dim), dtype=np.float32)
+        clients[client_names[i]] = ClientShard(video_embeddings, labels, shard, user_embedding)
+
     return clients
 
 
+def client_sample_counts(clients):
+    """Number of training samples per client, computed once from the shards."""
+    return {name: shard.num_samples for name, shard in clients.items()}
+
+
+def batch_clients(clients, bs=None):
+    """
+    ({name: tf.data.Dataset}, {name: sample count}) for create_clients output;
+    counts come from the shard lengths. bs=None puts each client in one batch.
+    """
+    datasets = {name: batch_data(shard, bs=bs or shard.num_samples) for name, shard in clients.items()}
+    return datasets, client_sample_counts(clients)
+
+
 def batch_data(data_shard, bs=32):
     """
     Takes in a client's data shard and creates a tf.data.Dataset object.
 
     Args:
-        data_shard: list of tuples (X_concat, y) for one client
+        data_shard: ClientShard, or list of tuples (X_concat, y) for one client
         bs: batch size
 
     Returns:
         tf.data.Dataset object
     """
+    if isinstance(data_shard, ClientShard):
+        return data_shard.dataset(bs)
+
     # Separate shard into data and labels
     data, labels = zip(*data_shard)
     
@@ -101,22 +172,20 @@ def test_model(X_test, Y_test, model, comm_round):
     print(f"Round {comm_round}: Test Accuracy: {acc:.4f}, Loss: {loss:.4f}")
     return acc, loss
 
-def weight_scaling_factor(clients_trn_data, client_name):
+def weight_scaling_factor(client_counts, client_name, global_count=None):
     '''
     This computes a scaling factor for the client’s model based on how much data it has relative to all clients.
 
     For example, if a client has 1,000 images and the total across all clients is 10,000 images, its scaling factor is 0.1.
 
     This ensures that clients with more data have more influence on the global model.
+
+    client_counts maps client name -> number of samples (see client_sample_counts),
+    so no dataset has to be iterated. Pass global_count to skip re-summing.
 '''
-    client_names = list(clients_trn_data.keys())
-    #get the bs
-    bs = list(clients_trn_data[client_name])[0][0].shape[0]
-    #first calculate the total training data points across clinets
-    global_count = sum([tf.data.experimental.cardinality(clients_trn_data[client_name]).numpy() for client_name in client_names])*bs
-    # get the total number of data points held by a client
-    local_count = tf.data.experimental.cardinality(clients_trn_data[client_name]).numpy()*bs
-    return local_count/global_count
+    if global_count is None:
+        global_count = sum(client_counts.values())
+    return client_counts[client_name] / global_count
 
 
 def scale_model_weights(weight, scalar):
@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+MODEL_NAME = "ViT-B/32"
+
+
+def model_dir_name(model_name):
+    return model_name.replace("/", "_")
+
+
+class VectorTable:
+    """
+    Append-only float32 matrix with a key per row.
+
+    Layout (readable with plain numpy, see federated/mock_api.load_from_store):
+        vectors.f32  raw row-major float32, `dim` columns
+        keys.tsv     one tab-separated key line per row, same order
+        meta.json    {"dim": ...}
+
+    Rows are appended vectors-first. After a crash the row count is the
+    smaller of the two files, and on load both are truncated to it, so a
+    partial tail never shifts the rows of later appends.
+    """
+
+    def __init__(self, path, dim=None):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        else:
+            self.dim = dim
+            if dim is not None:
+                self._write_meta()
+        self.index = {}
+        self.keys = []
+        self._load_keys()
+
+    def _write_meta(self):
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"dim": self.dim}, f)
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _keys_path(self):
+        return os.path.join(self.path, "keys.tsv")
+
+    def _stored_rows(self):
+        if not self.dim or not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (4 * self.dim)
+
+    def _load_keys(self):
+        lines = []
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path) as f:
+                lines = f.read().splitlines()
+        rows = min(len(lines), self._stored_rows())
+        # drop whatever an interrupted append left past the last complete row
+        if os.path.exists(self._vectors_path) and self.dim:
+            if os.path.getsize(self._vectors_path) != rows * self.dim * 4:
+                os.truncate(self._vectors_path, rows * self.dim * 4)
+        if len(lines) != rows:
+            with open(self._keys_path, "w") as f:
+                f.writelines(line + "\n" for line in lines[:rows])
+        for row, line in enumerate(lines[:rows]):
+            key = tuple(line.split("\t"))
+            self.keys.append(key)
+            self.index[key] = row
+
+    def __len__(self):
+        return len(self.keys)
+
+    def append(self, keys, vectors):
+        """Append rows; a key appended again points the index at the newest row."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(keys), -1)
+        with self.lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._write_meta()
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"expected {self.dim}-d vectors, got {vectors.shape[1]}")
+            start = len(self.keys)
+            with open(self._vectors_path, "ab") as f:
+                vectors.tofile(f)
+            with open(self._keys_path, "a") as f:
+                for key in keys:
+                    f.write("\t".join(str(k) for k in key) + "\n")
+            for row, key in enumerate(keys, start):
+                key = tuple(str(k) for k in key)
+                self.keys.append(key)
+                self.index[key] = row
+
+    def matrix(self):
+        """Memory-mapped (rows, dim) view of everything appended so far."""
+        rows = len(self.keys)
+        if rows == 0:
+            return np.empty((0, self.dim or 0), np.float32)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def rows_for(self, keys):
+        return [self.index.get(tuple(str(k) for k in key)) for key in keys]
+
+
+class EmbeddingStore:
+    """
+    Per-frame and per-video CLIP vectors for one model.
+
+    frames: key (content hash, frame timestamp in ms) -> frame embedding;
+            this is the cache consulted before running CLIP
+    videos: key (content hash, category) -> video embedding
+    """
+
+    def __init__(self, root="embeddings/store", model_name=MODEL_NAME, dim=None):
+        self.root = root
+        self.model_name = model_name
+        model_dir = model_dir_name(model_name)
+        self.frames = VectorTable(os.path.join(root, "frames", model_dir), dim)
+        self.videos = VectorTable(os.path.join(root, "videos", model_dir), dim)
+        self.video_index = {key[0]: row for key, row in self.videos.index.items()}
+
+    @staticmethod
+    def timestamp_ms(frame_idx, fps):
+        return int(round(frame_idx * 1000 / fps))
+
+    def cached_frames(self, digest, timestamps):
+        """Cached vectors for (digest, timestamp) as a list aligned with timestamps, None where missing."""
+        rows = self.frames.rows_for([(digest, ts) for ts in timestamps])
+        if not any(r is not None for r in rows):
+            return [None] * len(rows)
+        matrix = self.frames.matrix()
+        return [np.array(matrix[r]) if r is not None else None for r in rows]
+
+    def add_frames(self, digest, timestamps, vectors):
+        self.frames.append([(digest, ts) for ts in timestamps], vectors)
+
+    def video(self, digest):
+        row = self.video_index.get(digest)
+        return None if row is None else np.array(self.videos.matrix()[row])
+
+    def add_video(self, digest, category, vector):
+        self.videos.append([(digest, category)], [vector])
+        self.video_index[digest] = len(self.videos) - 1
+
+    def video_matrix(self):
+        """
+        (hashes, categories, memmapped vectors, rows): the latest row per
+        video is vectors[rows[i]]. The matrix still holds superseded rows;
+        gather through `rows` batch by batch rather than copying it.
+        """
+        rows = np.array(sorted(self.video_index.values()), dtype=np.int64)
+        keys = [self.videos.keys[r] for r in rows]
+        return [k[0] for k in keys], [k[1] for k in keys], self.videos.matrix(), rows
+
+
+class CachedEmbedder:
+    """
+    Wraps a BatchEmbedder with the frame cache: frames already embedded for
+    (content hash, timestamp, model) are read from the store, only the rest
+    go through CLIP, and the per-video mean is appended to the store.
+
+    Takes (digest, frames) pairs where frames is a sequence sampled at `fps`
+    or a frames.SampledVideo (adaptive selection: its own timestamps, and a
+    weighted mean); category_of(digest) labels the stored video row.
+    """
+
+    def __init__(self, embedder, store, fps=1, category_of=None):
+        self.embedder = embedder
+        self.store = store
+        self.fps = fps
+        self.category_of = category_of or (lambda digest: "")
+
+    def embed_videos(self, videos):
+        cached = {}
+
+        def misses():
+            for digest, frames in videos:
+                weights = None
+                if hasattr(frames, "timestamps_ms"):
+                    frames, timestamps, weights = list(frames.frames), frames.timestamps_ms, frames.weights
+                else:
+                    frames = list(frames)
+                    timestamps = [self.store.timestamp_ms(i, self.fps) for i in range(len(frames))]
+                hits = self.store.cached_frames(digest, timestamps)
+                cached[digest] = (timestamps, hits, weights)
+                yield digest, [f for f, hit in zip(frames, hits) if hit is None]
+
+        for digest, fresh in self.embedder.embed_videos(misses(), per_frame=True):
+            timestamps, hits, weights = cached.pop(digest)
+            if fresh is not None:
+                missing = [ts for ts, hit in zip(timestamps, hits) if hit is None]
+                self.store.add_frames(digest, missing, fresh)
+            fresh_iter = iter(fresh if fresh is not None else [])
+            vectors = [hit if hit is not None else next(fresh_iter) for hit in hits]
+            if not vectors:
+                yield digest, None
+                continue
+            embedding = np.average(vectors, axis=0, weights=weights).astype(np.float32)
+            self.store.add_video(digest, self.category_of(digest), embedding)
+            yield digest, embedding
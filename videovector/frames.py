@@ -0,0 +1,212 @@
+import shutil
+
+import cv2
+import ffmpeg
+import numpy as np
+
+CLIP_SIZE = 224  # CLIP ViT-B/32 input resolution
+
+
+def to_clip_input(frame, size=CLIP_SIZE):
+    """BGR frame -> RGB, shortest side resized to `size`, center-cropped (CLIP's own geometry)."""
+    h, w = frame.shape[:2]
+    scale = size / min(h, w)
+    new_w, new_h = max(size, round(w * scale)), max(size, round(h * scale))
+    frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    top, left = (new_h - size) // 2, (new_w - size) // 2
+    frame = frame[top:top + size, left:left + size]
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def _sample_ffmpeg(video_path, fps, size, duration):
+    """
+    Let ffmpeg drop frames with the fps filter before scaling/cropping, so only
+    sampled frames are converted and piped out, already at `size` x `size` RGB.
+    """
+    stream = ffmpeg.input(video_path, t=duration) if duration else ffmpeg.input(video_path)
+    process = (
+        stream
+        .filter('fps', fps=fps)
+        .filter('scale', size, size, force_original_aspect_ratio='increase')
+        .filter('crop', size, size)
+        .output('pipe:', format='rawvideo', pix_fmt='rgb24')
+        .global_args('-loglevel', 'error')  # keep stderr small, it is piped but never drained
+        .run_async(pipe_stdout=True, quiet=True)
+    )
+    frame_bytes = size * size * 3
+    try:
+        while True:
+            buf = process.stdout.read(frame_bytes)
+            if len(buf) < frame_bytes:
+                break
+            yield np.frombuffer(buf, np.uint8).reshape(size, size, 3)
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+
+def _sample_cv2(video_path, fps, size, duration):
+    """
+    grab() skips frames without retrieve(), so skipped frames are never
+    color-converted or copied out of the decoder.
+    """
+    cap = cv2.VideoCapture(video_path)
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    frame_interval = max(int(video_fps / fps), 1)
+    max_frames = int(duration * video_fps) if duration else None
+    count = 0
+    try:
+        while max_frames is None or count < max_frames:
+            if not cap.grab():
+                break
+            if count % frame_interval == 0:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                yield to_clip_input(frame, size)
+            count += 1
+    finally:
+        cap.release()
+
+
+def sample_frames(video_path, fps=1, size=CLIP_SIZE, duration=None, backend=None):
+    """
+    Yield RGB frames sampled at `fps`, already at CLIP's input size.
+
+    backend: "ffmpeg" (fps/scale filters in a subprocess) or "cv2"
+    (grab-without-retrieve). Defaults to ffmpeg when the binary is available.
+    """
+    if backend is None:
+        backend = "ffmpeg" if shutil.which("ffmpeg") else "cv2"
+    if backend == "ffmpeg":
+        return _sample_ffmpeg(video_path, fps, size, duration)
+    return _sample_cv2(video_path, fps, size, duration)
+
+
+# -----------------------------
+# Adaptive, shot-aware selection
+# -----------------------------
+FRAME_BUDGET = 8        # max frames sent to CLIP per video
+SHOT_THRESHOLD = 0.12   # signature distance that starts a new shot
+THUMB_SIZE = 16
+
+
+class SampledVideo:
+    """Frames chosen for embedding, their sample indices and timestamps (ms), and how many sampled frames each stands for."""
+
+    def __init__(self, frames, indices, timestamps_ms, weights):
+        self.frames = frames
+        self.indices = indices
+        self.timestamps_ms = timestamps_ms
+        self.weights = weights
+
+    def __len__(self):
+        return len(self.frames)
+
+
+def frame_signature(frame):
+    """Cheap per-frame signal: 16x16 thumbnail plus a normalized hue/saturation histogram."""
+    thumb = cv2.resize(frame, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32) / 255
+    hsv = cv2.cvtColor(frame, cv2.COLOR_RGB2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 8], [0, 180, 0, 256]).ravel()
+    hist /= hist.sum() or 1
+    return thumb, hist
+
+
+def signature_distance(a, b):
+    """Max of mean absolute thumbnail difference and histogram L1/2 distance, both in [0, 1]."""
+    return max(float(np.abs(a[0] - b[0]).mean()), float(np.abs(a[1] - b[1]).sum() / 2))
+
+
+def select_frames(frames, fps=1, budget=FRAME_BUDGET, threshold=SHOT_THRESHOLD):
+    """
+    Split sampled frames into shots and keep one representative per shot.
+
+    A frame starts a new shot when it is further than `threshold` from the
+    first frame of the current shot. If there are more shots than `budget`,
+    the most similar adjacent shots are merged. Each kept frame is weighted
+    by the number of frames in its shot, so the weighted mean of kept
+    embeddings approximates the dense mean.
+    """
+    frames = list(frames)
+    if not frames:
+        return SampledVideo([], [], [], [])
+    signatures = [frame_signature(f) for f in frames]
+
+    shots = [[0]]
+    for i in range(1, len(frames)):
+        if signature_distance(signatures[i], signatures[shots[-1][0]]) > threshold:
+            shots.append([i])
+        else:
+            shots[-1].append(i)
+
+    def representative(shot):
+        return shot[len(shot) // 2]
+
+    while len(shots) > max(1, budget):
+        gaps = [signature_distance(signatures[representative(a)], signatures[representative(b)])
+                for a, b in zip(shots, shots[1:])]
+        i = int(np.argmin(gaps))
+        shots[i:i + 2] = [shots[i] + shots[i + 1]]
+
+    keep = [representative(shot) for shot in shots]
+    return SampledVideo(
+        [frames[i] for i in keep],
+        keep,
+        [int(round(i * 1000 / fps)) for i in keep],
+        [len(shot) for shot in shots],
+    )
+
+
+def embedding_drift(frame_embeddings, selection_idx, weights):
+    """
+    Cosine similarity between the dense mean embedding and the weighted mean
+    of the selected frames (1.0 means no drift).
+    """
+    dense = np.mean(frame_embeddings, axis=0)
+    adaptive = np.average(frame_embeddings[selection_idx], axis=0, weights=weights)
+    return float(dense @ adaptive / (np.linalg.norm(dense) * np.linalg.norm(adaptive)))
+
+
+def drift_report(embedder, video_paths, fps=1, duration=5, budget=FRAME_BUDGET, threshold=SHOT_THRESHOLD):
+    """
+    Embed every sampled frame once, then compare dense vs adaptive means.
+    Returns one dict per video plus the overall CLIP call reduction.
+    """
+    sampled = {path: list(sample_frames(path, fps=fps, duration=duration)) for path in video_paths}
+    dense = dict(embedder.embed_videos(sampled.items(), per_frame=True))
+
+    report, dense_calls, adaptive_calls = [], 0, 0
+    for path, frames in sampled.items():
+        if dense.get(path) is None:
+            continue
+        selection = select_frames(frames, fps=fps, budget=budget, threshold=threshold)
+        dense_calls += len(frames)
+        adaptive_calls += len(selection)
+        report.append({
+            "video": path,
+            "dense_frames": len(frames),
+            "adaptive_frames": len(selection),
+            "cosine_to_dense": embedding_drift(dense[path], selection.indices, selection.weights),
+        })
+    summary = {"clip_calls_dense": dense_calls, "clip_calls_adaptive": adaptive_calls,
+               "reduction": 1 - adaptive_calls / dense_calls if dense_calls else 0.0}
+    return report, summary
+
+
+if __name__ == "__main__":
+    # python frames.py clip1.mp4 clip2.mp4 ...  -> adaptive vs dense drift report
+    import json
+    import sys
+
+    import clip
+    import torch
+    from embedder import BatchEmbedder
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model, preprocess = clip.load("ViT-B/32", device=device)
+    model.eval()
+    report, summary = drift_report(BatchEmbedder(model, preprocess, device=device, bgr=False), sys.argv[1:], fps=2, budget=4)
+    print(json.dumps({"videos": report, "summary": summary}, indent=2))
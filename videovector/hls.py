@@ -0,0 +1,179 @@
+import os
+import re
+import sys
+from collections import namedtuple
+
+import ffmpeg
+
+# One HLS variant: width-capped like compress_video's target_width, capped-CRF bitrate.
+# Names are the width cap ("540w"), not a height: clips are mostly portrait.
+Rendition = namedtuple("Rendition", "name width maxrate bufsize audio_bitrate")
+
+# The last rung is the largest; it is remuxed into the progressive mp4 (remux_progressive)
+LADDER = (
+    Rendition("360w", 360, "900k", "1800k", "64k"),
+    Rendition("540w", 540, "1800k", "3600k", "96k"),
+    Rendition("1080w", 1080, "5000k", "10000k", "128k"),
+)
+SEGMENT_SECONDS = 2
+MASTER_PLAYLIST = "master.m3u8"
+VARIANT_PLAYLIST = "index.m3u8"
+POSTER = "poster.jpg"
+POSTER_WIDTH = 540
+
+
+def rendition_outputs(video, audio, out_dir, ladder=LADDER, segment_seconds=SEGMENT_SECONDS):
+    """
+    ffmpeg-python outputs for every rendition of the ladder, fed from the
+    split `video` streams (one per rendition) and the shared optional audio.
+
+    Keyframes are forced on segment boundaries so all variants switch on
+    the same timestamps.
+    """
+    outputs = []
+    for stream, rendition in zip(video, ladder):
+        variant_dir = os.path.join(out_dir, rendition.name)
+        os.makedirs(variant_dir, exist_ok=True)
+        outputs.append(ffmpeg.output(
+            stream.filter('scale', f"min(iw,{rendition.width})", -2),
+            audio,
+            os.path.join(variant_dir, VARIANT_PLAYLIST),
+            format='hls',
+            hls_time=segment_seconds,
+            hls_playlist_type='vod',
+            hls_segment_filename=os.path.join(variant_dir, "seg_%03d.ts"),
+            vcodec='libx264',
+            crf=23,
+            preset='fast',
+            maxrate=rendition.maxrate,
+            bufsize=rendition.bufsize,
+            force_key_frames=f"expr:gte(t,n_forced*{segment_seconds})",
+            sc_threshold=0,
+            acodec='aac',
+            audio_bitrate=rendition.audio_bitrate
+        ))
+    return outputs
+
+
+def poster_output(sampled, out_dir, width=POSTER_WIDTH):
+    """First sampled frame, at poster width, as out_dir/poster.jpg."""
+    return ffmpeg.output(
+        sampled.filter('scale', f"min(iw,{width})", -2),
+        os.path.join(out_dir, POSTER),
+        vframes=1,
+        **{'q:v': 3}
+    )
+
+
+def remux_progressive(out_dir, output_path, rendition=LADDER[-1]):
+    """
+    Copy `rendition`'s segments into a single faststart mp4 at output_path,
+    the progressive fallback, without re-encoding. Raises ffmpeg.Error.
+    """
+    (
+        ffmpeg
+        .input(os.path.join(out_dir, rendition.name, VARIANT_PLAYLIST))
+        .output(output_path, c='copy', movflags='+faststart')
+        .overwrite_output()
+        .global_args('-loglevel', 'error')
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return output_path
+
+
+def _segments(playlist_path):
+    """(duration, segment path) pairs listed in a variant playlist."""
+    segments, duration = [], None
+    with open(playlist_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line and not line.startswith("#") and duration is not None:
+                segments.append((duration, os.path.join(os.path.dirname(playlist_path), line)))
+                duration = None
+    return segments
+
+
+def write_master_playlist(out_dir, ladder=LADDER):
+    """
+    Write master.m3u8 for the renditions found in out_dir. BANDWIDTH is the
+    peak and AVERAGE-BANDWIDTH the mean segment bitrate actually produced,
+    RESOLUTION comes from probing each variant's first segment (when ffprobe is available).
+    """
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for rendition in ladder:
+        playlist = os.path.join(out_dir, rendition.name, VARIANT_PLAYLIST)
+        if not os.path.exists(playlist):
+            continue
+        segments = _segments(playlist)
+        if not segments:
+            continue
+        rates = [os.path.getsize(path) * 8 / max(duration, 1e-3) for duration, path in segments]
+        total_bits = sum(os.path.getsize(path) * 8 for _, path in segments)
+        total_seconds = sum(duration for duration, _ in segments)
+        info = [f"BANDWIDTH={int(max(rates))}", f"AVERAGE-BANDWIDTH={int(total_bits / max(total_seconds, 1e-3))}"]
+        try:
+            stream = next((s for s in ffmpeg.probe(segments[0][1])["streams"] if s["codec_type"] == "video"), None)
+        except (ffmpeg.Error, OSError):
+            stream = None  # RESOLUTION is optional, players fall back to the playlist order
+        if stream:
+            info.append(f"RESOLUTION={stream['width']}x{stream['height']}")
+        lines.append("#EXT-X-STREAM-INF:" + ",".join(info))
+        lines.append(f"{rendition.name}/{VARIANT_PLAYLIST}")
+
+    path = os.path.join(out_dir, MASTER_PLAYLIST)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+    return path
+
+
+def ladder_report(out_dir, progressive_path=None, ladder=LADDER):
+    """
+    Bytes a player fetches before the first frame (master + lowest variant
+    playlist + its first segment) and per rendition for the whole clip,
+    next to the single progressive file when given.
+    """
+    with open(os.path.join(out_dir, MASTER_PLAYLIST)) as f:
+        variants = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    report = {"renditions": {}}
+    for variant in variants:
+        playlist = os.path.join(out_dir, variant)
+        segments = _segments(playlist)
+        report["renditions"][variant.split("/")[0]] = {
+            "segments": len(segments),
+            "bytes": sum(os.path.getsize(path) for _, path in segments),
+            "first_segment_bytes": os.path.getsize(segments[0][1]) if segments else 0,
+        }
+    if variants:
+        lowest = report["renditions"][variants[0].split("/")[0]]
+        report["first_frame_bytes"] = (os.path.getsize(os.path.join(out_dir, MASTER_PLAYLIST))
+                                       + os.path.getsize(os.path.join(out_dir, variants[0]))
+                                       + lowest["first_segment_bytes"])
+    if progressive_path:
+        report["progressive_bytes"] = os.path.getsize(progressive_path)
+    return report
+
+
+def is_complete(out_dir):
+    return bool(out_dir) and os.path.exists(os.path.join(out_dir, MASTER_PLAYLIST))
+
+
+if __name__ == "__main__":
+    # python hls.py input.mp4 [out_dir]
+    # then: python -m http.server -d out_dir 8000  and  ffplay http://localhost:8000/master.m3u8
+    import json
+    from ingest import SinglePassJob
+
+    source = sys.argv[1]
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else re.sub(r"\.\w+$", "", os.path.basename(source)) + "_hls"
+    progressive = out_dir.rstrip("/") + ".mp4"
+    os.makedirs(out_dir, exist_ok=True)
+    job = SinglePassJob(source, progressive, hls_dir=out_dir)
+    frames = list(job.frames())
+    if job.error:
+        raise SystemExit(job.error)
+    print(f"{len(frames)} sampled frames, ladder in {out_dir}")
+    print(json.dumps(ladder_report(out_dir, progressive), indent=2))
@@ -0,0 +1,107 @@
+import ffmpeg
+import numpy as np
+
+from frames import CLIP_SIZE
+from hls import LADDER, SEGMENT_SECONDS, poster_output, remux_progressive, rendition_outputs, write_master_playlist
+
+
+class SinglePassJob:
+    """
+    Decode a source video once and produce both outputs from one ffmpeg
+    filter graph: the trimmed, compressed upload rendition written to
+    `output_path`, and sampled RGB frames at CLIP size piped to NumPy.
+
+    With `hls_dir` set, the same decode feeds an HLS ladder (one rendition
+    per `ladder` entry) and a poster taken from the first sampled frame
+    instead. The upload file is then not encoded separately: once ffmpeg
+    finishes it is remuxed from the top rung (so `target_width` gives way to
+    that rung's width cap) and master.m3u8 is written.
+
+    Iterate `frames()` to drive the job; when it is exhausted the upload file
+    is complete and `error` is None, or holds ffmpeg's message on failure.
+    """
+
+    def __init__(self, input_path, output_path, target_width=1080, duration=5, fps=1, size=CLIP_SIZE,
+                 hls_dir=None, ladder=LADDER, segment_seconds=SEGMENT_SECONDS):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.target_width = target_width
+        self.duration = duration
+        self.fps = fps
+        self.size = size
+        self.hls_dir = hls_dir
+        self.ladder = ladder
+        self.segment_seconds = segment_seconds
+        self.error = None
+        self.num_frames = 0
+
+    def _command(self):
+        source = ffmpeg.input(self.input_path, t=self.duration)
+        ladder = self.ladder if self.hls_dir else ()
+        video = source.video.filter_multi_output('split', 1 + len(ladder) if ladder else 2)
+        audio = source['a?']  # audio is optional, not every clip has a track
+
+        sampled = video[0].filter('fps', fps=self.fps)
+        if ladder:
+            # the top rung doubles as the upload file (remuxed in frames()), no second full-size encode
+            sampled = sampled.filter_multi_output('split')
+            outputs = rendition_outputs([video[1 + i] for i in range(len(ladder))], audio, self.hls_dir,
+                                        ladder, self.segment_seconds)
+            outputs.append(poster_output(sampled[1], self.hls_dir))
+            sampled = sampled[0]
+        else:
+            outputs = [ffmpeg.output(
+                video[1].filter('scale', self.target_width, -2),
+                audio,
+                self.output_path,
+                vcodec='libx264',
+                crf=23,
+                preset='fast',
+                acodec='aac',
+                audio_bitrate='128k'
+            )]
+        outputs.append(ffmpeg.output(
+            sampled
+            .filter('scale', self.size, self.size, force_original_aspect_ratio='increase')
+            .filter('crop', self.size, self.size),
+            'pipe:',
+            format='rawvideo',
+            pix_fmt='rgb24'
+        ))
+        return ffmpeg.merge_outputs(*outputs).overwrite_output().global_args('-loglevel', 'error')
+
+    def frames(self):
+        process = self._command().run_async(pipe_stdout=True, pipe_stderr=True)
+        frame_bytes = self.size * self.size * 3
+        exhausted = False
+        try:
+            while True:
+                buf = process.stdout.read(frame_bytes)
+                if len(buf) < frame_bytes:
+                    exhausted = True
+                    break
+                self.num_frames += 1
+                yield np.frombuffer(buf, np.uint8).reshape(self.size, self.size, 3)
+        finally:
+            process.stdout.close()
+            if not exhausted:
+                # consumer stopped early, the upload rendition would be truncated anyway
+                process.kill()
+            stderr = process.stderr.read().decode(errors='replace')
+            process.wait()
+            if process.returncode != 0:
+                self.error = stderr.strip() or f"ffmpeg exited with {process.returncode}"
+                print(f"Error processing {self.input_path}: {self.error}")
+            elif self.hls_dir:
+                try:
+                    remux_progressive(self.hls_dir, self.output_path, self.ladder[-1])
+                except ffmpeg.Error as e:
+                    self.error = e.stderr.decode(errors='replace').strip() or str(e)
+                    print(f"Error remuxing {self.input_path}: {self.error}")
+                else:
+                    write_master_playlist(self.hls_dir, self.ladder)
+
+
+def transcode_and_sample(input_path, output_path, target_width=1080, duration=5, fps=1, size=CLIP_SIZE, hls_dir=None):
+    """Convenience wrapper: returns a SinglePassJob for one video."""
+    return SinglePassJob(input_path, output_path, target_width, duration, fps, size, hls_dir=hls_dir)
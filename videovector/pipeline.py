@@ -0,0 +1,315 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import numpy as np
+
+from frames import select_frames, SHOT_THRESHOLD
+from hls import MASTER_PLAYLIST, POSTER, is_complete
+from ingest import transcode_and_sample
+
+# Stages a file goes through, in order
+STAGES = ("transcoded", "embedded", "uploaded", "inserted")
+
+DECODE_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+HASH_WORKERS = 8
+HASH_CHUNK = 1 << 20
+
+
+def content_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class StageTimer:
+    """Calls, total and max wall time per ingestion stage, safe to feed from worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            calls, total, longest = self.stages.get(stage, (0, 0.0, 0.0))
+            self.stages[stage] = (calls + 1, total + seconds, max(longest, seconds))
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def total(self, stage):
+        return self.stages.get(stage, (0, 0.0, 0.0))[1]
+
+    def summary(self):
+        with self.lock:
+            return {stage: {"calls": calls, "seconds": round(total, 3), "max_seconds": round(longest, 3)}
+                    for stage, (calls, total, longest) in self.stages.items()}
+
+
+def write_prometheus(stats, path):
+    """Write run_ingestion stats in Prometheus text format (node_exporter textfile collector)."""
+    lines = ["# TYPE ingest_files gauge"]
+    lines += [f'ingest_files{{outcome="{k}"}} {v}' for k, v in stats.items() if isinstance(v, int)]
+    for name, key in (("ingest_stage_seconds", "seconds"), ("ingest_stage_calls", "calls"),
+                      ("ingest_stage_max_seconds", "max_seconds")):
+        lines.append(f"# TYPE {name} gauge")
+        lines += [f'{name}{{stage="{stage}"}} {values[key]}' for stage, values in stats.get("stages", {}).items()]
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+class Manifest:
+    """
+    Persistent record of ingestion progress, keyed by content hash.
+
+    Content hashes are cached per (path, size, mtime) so unchanged files
+    are never re-read on a rerun. Safe to update from worker threads.
+    """
+
+    def __init__(self, path="manifest.sqlite"):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS paths (
+            path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS videos (
+            hash TEXT PRIMARY KEY, source TEXT, category TEXT, stages TEXT DEFAULT '[]',
+            compressed_path TEXT, url TEXT, embedding BLOB)""")
+        # columns added after the first release; older manifests are migrated in place
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(videos)")}
+        for column in ("hls_dir", "manifest_url", "poster_url"):
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE videos ADD COLUMN {column} TEXT")
+        self.db.commit()
+
+    def hash_for(self, path):
+        st = os.stat(path)
+        with self.lock:
+            row = self.db.execute("SELECT size, mtime_ns, hash FROM paths WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        digest = content_hash(path)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO paths VALUES (?, ?, ?, ?)", (path, st.st_size, st.st_mtime_ns, digest))
+            self.db.commit()
+        return digest
+
+    def get(self, digest):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT source, category, stages, compressed_path, url, embedding, hls_dir, manifest_url, poster_url "
+                "FROM videos WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        source, category, stages, compressed_path, url, embedding, hls_dir, manifest_url, poster_url = row
+        return {
+            "hash": digest, "source": source, "category": category, "stages": set(json.loads(stages)),
+            "compressed_path": compressed_path, "url": url,
+            "hls_dir": hls_dir, "manifest_url": manifest_url, "poster_url": poster_url,
+            "embedding": np.frombuffer(embedding, np.float32) if embedding is not None else None,
+        }
+
+    def register(self, digest, source, category):
+        with self.lock:
+            self.db.execute("INSERT OR IGNORE INTO videos (hash, source, category) VALUES (?, ?, ?)", (digest, source, category))
+            self.db.commit()
+
+    def mark(self, digest, stage, **fields):
+        """Record a completed stage plus any of compressed_path/url/embedding/hls_dir/manifest_url/poster_url."""
+        if "embedding" in fields:
+            fields["embedding"] = np.asarray(fields["embedding"], np.float32).tobytes()
+        with self.lock:
+            (stages,) = self.db.execute("SELECT stages FROM videos WHERE hash = ?", (digest,)).fetchone()
+            stages = sorted(set(json.loads(stages)) | {stage}, key=STAGES.index)
+            assignments = ", ".join(f"{k} = ?" for k in fields)
+            sql = "UPDATE videos SET stages = ?" + (f", {assignments}" if fields else "") + " WHERE hash = ?"
+            self.db.execute(sql, (json.dumps(stages), *fields.values(), digest))
+            self.db.commit()
+
+    def embeddings(self):
+        """All stored embeddings as {category: [vector, ...]}."""
+        out = {}
+        with self.lock:
+            rows = self.db.execute("SELECT category, embedding FROM videos WHERE embedding IS NOT NULL ORDER BY source").fetchall()
+        for category, blob in rows:
+            out.setdefault(category, []).append(np.frombuffer(blob, np.float32))
+        return out
+
+
+def decode_video(input_path, output_path, target_width=1080, duration=5, fps=1,
+                 frame_budget=None, shot_threshold=SHOT_THRESHOLD, hls_dir=None):
+    """
+    Process-pool worker: one single-pass transcode + frame sample (+ HLS
+    ladder and poster into hls_dir when given).
+    With frame_budget set, frames are reduced to one per shot (frames.select_frames)
+    here, before anything is sent back to the embedding stage.
+    Returns (stacked frames / SampledVideo or None, error message or None).
+    """
+    job = transcode_and_sample(input_path, output_path, target_width=target_width, duration=duration, fps=fps,
+                               hls_dir=hls_dir)
+    frames = list(job.frames())
+    if job.error:
+        return None, job.error
+    if not frames:
+        return None, None
+    if frame_budget:
+        return select_frames(frames, fps=fps, budget=frame_budget, threshold=shot_threshold), None
+    return np.stack(frames), None
+
+
+def _timed_decode(*args, **kwargs):
+    start = time.perf_counter()
+    result = decode_video(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_ingestion(video_files, manifest, embedder, writer, to_row, compressed_folder="compressed",
+                  decode_workers=DECODE_WORKERS, hash_workers=HASH_WORKERS, duration=5, fps=1,
+                  frame_budget=None, shot_threshold=SHOT_THRESHOLD, hls=False):
+    """
+    Ingest (path, category) pairs, skipping any stage the manifest already has.
+
+    decode: process pool running single-pass ffmpeg jobs (and adaptive
+            frame selection when frame_budget is set; HLS ladder + poster
+            when hls is set)
+    embed:  `embedder.embed_videos`, batched across whatever has been decoded
+    publish: `writer` (a writer.BulkWriter) uploads concurrently and stores
+             to_row(record) in batches; a file is marked inserted once its
+             batch is committed. With hls, the ladder is uploaded under the
+             hash prefix and the record carries manifest_url/poster_url.
+
+    Drains the writer before returning counts of files per outcome, the
+    number of failed background writes under "write_errors", plus
+    per-stage timings under "stages" (decode is per video in its worker;
+    decode_wait is time the embedder sat idle waiting for decodes).
+    """
+    os.makedirs(compressed_folder, exist_ok=True)
+    stats = {"skipped": 0, "decoded": 0, "embedded": 0, "inserted": 0}
+    stats_lock = threading.Lock()
+    timer = StageTimer()
+
+    def count(key):
+        with stats_lock:
+            stats[key] += 1
+
+    # 1. Identify files by content; cheap for files seen before
+    with timer.span("hash"), ThreadPoolExecutor(hash_workers) as pool:
+        hashes = list(pool.map(lambda item: manifest.hash_for(item[0]), video_files))
+
+    to_decode, to_publish, seen = {}, [], set()
+    for (path, category), digest in zip(video_files, hashes):
+        manifest.register(digest, path, category)
+        record = manifest.get(digest)
+        if "inserted" in record["stages"] or digest in seen:
+            stats["skipped"] += 1
+            continue
+        seen.add(digest)
+        if "embedded" in record["stages"] and ("uploaded" in record["stages"] or (
+                os.path.exists(record["compressed_path"] or "") and (not hls or is_complete(record["hls_dir"])))):
+            to_publish.append(digest)
+        else:
+            hls_dir = os.path.join(compressed_folder, f"{digest[:16]}_hls") if hls else None
+            to_decode[digest] = (path, os.path.join(compressed_folder, f"{digest[:16]}.mp4"), hls_dir)
+
+    def committed(digest):
+        def on_commit():
+            manifest.mark(digest, "inserted")
+            count("inserted")
+        return on_commit
+
+    def publish(digest):
+        record = manifest.get(digest)
+        if "uploaded" in record["stages"]:
+            writer.write(to_row(record), on_commit=committed(digest))
+            return
+
+        # the row is written once the progressive file and (with hls) the whole ladder are up
+        fields, state = {}, {"pending": 2 if record["hls_dir"] else 1, "failed": False}
+        lock = threading.Lock()
+
+        def uploaded(update, error):
+            with lock:
+                if state["failed"]:
+                    return
+                if error or not update:
+                    state["failed"] = True
+                else:
+                    fields.update(update)
+                    state["pending"] -= 1
+                    if state["pending"]:
+                        return
+            if state["failed"]:
+                print(f"Upload failed for {record['source']}: {error}")
+                return
+            manifest.mark(digest, "uploaded", **fields)
+            writer.write(to_row(manifest.get(digest)), on_commit=committed(digest))
+
+        writer.upload(record["compressed_path"],
+                      then=lambda url, error: uploaded(url and {"url": url}, error))
+        if record["hls_dir"]:
+            writer.upload_dir(record["hls_dir"], digest[:16], then=lambda urls, error: uploaded(
+                urls and {"manifest_url": urls[MASTER_PLAYLIST], "poster_url": urls.get(POSTER)}, error))
+
+    for digest in to_publish:
+        publish(digest)
+
+    # 2. Decode in parallel processes, embed in shared batches as results arrive
+    if to_decode:
+        ctx = multiprocessing.get_context("spawn")  # torch and fork don't mix
+        with ProcessPoolExecutor(decode_workers, mp_context=ctx) as decode_pool:
+            futures = {decode_pool.submit(_timed_decode, src, out, duration=duration, fps=fps,
+                                          frame_budget=frame_budget, shot_threshold=shot_threshold,
+                                          hls_dir=hls_dir): digest
+                       for digest, (src, out, hls_dir) in to_decode.items()}
+
+            def decoded():
+                waiting = time.perf_counter()
+                for future in as_completed(futures):
+                    timer.observe("decode_wait", time.perf_counter() - waiting)
+                    digest = futures[future]
+                    (frames, error), seconds = future.result()
+                    timer.observe("decode", seconds)
+                    if error or frames is None:
+                        print(f"Skipping {to_decode[digest][0]}: {error or 'no frames'}")
+                        continue
+                    count("decoded")
+                    _, compressed_path, hls_dir = to_decode[digest]
+                    manifest.mark(digest, "transcoded", compressed_path=compressed_path, hls_dir=hls_dir)
+                    yield digest, frames
+                    waiting = time.perf_counter()
+
+            started = time.perf_counter()
+            for digest, embedding in embedder.embed_videos(decoded()):
+                with timer.span("publish"):
+                    manifest.mark(digest, "embedded", embedding=embedding)
+                    count("embedded")
+                    publish(digest)
+            # whatever the loop spent outside decode waits and publishing went to the embedder
+            timer.observe("embed", time.perf_counter() - started - timer.total("decode_wait") - timer.total("publish"))
+
+    # 3. Wait for uploads and the last partial batch
+    try:
+        with timer.span("drain"):
+            writer.drain()
+    except Exception as e:
+        print(f"Final flush failed: {e}")
+    # decode, upload or store failures, and anything still uncommitted, in one number
+    stats["not_inserted"] = len(seen) - stats["inserted"]
+    stats["write_errors"] = len(writer.errors)
+    stats["stages"] = timer.summary()
+    return stats
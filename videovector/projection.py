@@ -0,0 +1,162 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+GEN_DIM = 16          # gen_vector size expected by /recommend and BinaryMLP
+FIT_BATCH = 4096
+PAGE_SIZE = 1000
+projection_dir = "projections"
+
+
+class Projection:
+    """Linear 512 -> 16 projection: gen_vector = (video_vector - mean) @ components.T"""
+
+    def __init__(self, mean, components, explained_variance=None, version=None, meta=None):
+        self.mean = np.asarray(mean, np.float32)
+        self.components = np.asarray(components, np.float32)
+        self.explained_variance = explained_variance
+        self.version = version
+        self.meta = meta or {}
+
+    def project(self, vectors):
+        """Project a (N, 512) batch in one matmul, returning (N, 16) float32."""
+        vectors = np.asarray(vectors, np.float32)
+        return (vectors - self.mean) @ self.components.T
+
+    def apply_to_rows(self, rows):
+        """Fill gen_vector (and the projection version it came from) for table rows that carry video_vector."""
+        if not rows:
+            return rows
+        gen = self.project(np.stack([np.asarray(r["video_vector"], np.float32) for r in rows]))
+        for row, g in zip(rows, gen):
+            row["gen_vector"] = g.tolist()
+            row["gen_vector_version"] = self.version
+        return rows
+
+
+def fit_projection(vectors, dim=GEN_DIM, batch_size=FIT_BATCH, rows=None):
+    """
+    PCA fitted in streaming mini-batches: only the running sum and the
+    (D, D) scatter matrix are kept, so `vectors` can be a memmap of any size.
+    With `rows`, only those rows are used, gathered one batch at a time.
+    """
+    n, d = (len(rows), vectors.shape[1]) if rows is not None else vectors.shape
+    if n < 2:
+        raise ValueError("need at least two vectors to fit a projection")
+    total = np.zeros(d, np.float64)
+    scatter = np.zeros((d, d), np.float64)
+    for start in range(0, n, batch_size):
+        batch = vectors[start:start + batch_size] if rows is None else vectors[rows[start:start + batch_size]]
+        batch = np.asarray(batch, np.float64)
+        total += batch.sum(axis=0)
+        scatter += batch.T @ batch
+
+    mean = total / n
+    cov = (scatter - n * np.outer(mean, mean)) / (n - 1)
+    eigvals, eigvecs = np.linalg.eigh(cov)
+    top = np.argsort(eigvals)[::-1][:dim]
+    components = eigvecs[:, top].T
+    # deterministic sign so re-fits on the same data give the same gen_vectors
+    signs = np.sign(components[np.arange(len(top)), np.abs(components).argmax(axis=1)])
+    components *= signs[:, None]
+    return Projection(mean, components, explained_variance=eigvals[top],
+                      meta={"fitted_on": n, "explained_ratio": float(eigvals[top].sum() / eigvals.sum())})
+
+
+def save_projection(projection, root=projection_dir):
+    """Write the projection as the next version and point `latest` at it."""
+    os.makedirs(root, exist_ok=True)
+    versions = [int(f[1:-4]) for f in os.listdir(root) if f.startswith("v") and f.endswith(".npz")]
+    version = max(versions, default=0) + 1
+    path = os.path.join(root, f"v{version}.npz")
+    np.savez(path, mean=projection.mean, components=projection.components,
+             explained_variance=projection.explained_variance if projection.explained_variance is not None else [])
+    projection.version = version
+    meta = dict(projection.meta, version=version, created_at=time.time())
+    with open(os.path.join(root, f"v{version}.json"), "w") as f:
+        json.dump(meta, f)
+    tmp = os.path.join(root, "latest.tmp")
+    with open(tmp, "w") as f:
+        f.write(str(version))
+    os.replace(tmp, os.path.join(root, "latest"))
+    return version
+
+
+def load_projection(root=projection_dir, version=None):
+    """Load a saved projection (latest by default), or None if none exists."""
+    if version is None:
+        latest = os.path.join(root, "latest")
+        if not os.path.exists(latest):
+            return None
+        with open(latest) as f:
+            version = int(f.read().strip())
+    data = np.load(os.path.join(root, f"v{version}.npz"))
+    meta_path = os.path.join(root, f"v{version}.json")
+    meta = json.load(open(meta_path)) if os.path.exists(meta_path) else {}
+    return Projection(data["mean"], data["components"], data["explained_variance"], version, meta)
+
+
+def _as_vector(value):
+    # pgvector columns come back as "[...]" strings, json columns as lists
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def reproject_catalog(supabase, projection, writer, page_size=PAGE_SIZE):
+    """
+    Recompute gen_vector for every row of the videos table: each page is
+    projected in one matmul and written back through `writer` (a BulkWriter
+    with on_conflict="id"), so the whole catalog is a single streaming pass.
+
+    Pages are read by id (keyset), so the upserts made during the pass can't
+    shift later pages. Every written row records gen_vector_version, and
+    rows already at projection.version are skipped, so an interrupted pass
+    is resumed by running it again. Returns (updated, already current).
+    """
+    last_id, updated, current = None, 0, 0
+    while True:
+        query = supabase.table("videos").select("id, video_vector, gen_vector_version").order("id")
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.limit(page_size).execute().data
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+        stale = [r for r in rows if r.get("video_vector") and r.get("gen_vector_version") != projection.version]
+        current += sum(1 for r in rows if r.get("gen_vector_version") == projection.version)
+        if stale:
+            gen = projection.project(np.array([_as_vector(r["video_vector"]) for r in stale], np.float32))
+            for row, g in zip(stale, gen):
+                writer.write({"id": row["id"], "gen_vector": g.tolist(), "gen_vector_version": projection.version})
+            updated += len(stale)
+    writer.flush()
+    return updated, current
+
+
+if __name__ == "__main__":
+    # python projection.py fit     -> fit a new version on the embedding store
+    # python projection.py apply   -> rewrite gen_vector for the whole catalog
+    from embedding_store import EmbeddingStore
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "fit"
+    if command == "fit":
+        _, _, vectors, rows = EmbeddingStore(os.path.join("embeddings", "store")).video_matrix()
+        projection = fit_projection(vectors, rows=rows)
+        version = save_projection(projection)
+        print(f"Saved projection v{version} fitted on {len(rows)} videos "
+              f"({projection.meta['explained_ratio']:.1%} variance kept)")
+    elif command == "apply":
+        from supabase import create_client
+        import config
+        from writer import BulkWriter, SupabaseTable
+
+        supabase = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+        projection = load_projection()
+        if projection is None:
+            raise SystemExit("No projection saved yet, run `python projection.py fit` first")
+        with BulkWriter(None, SupabaseTable(supabase, "videos"), batch_size=PAGE_SIZE, on_conflict="id") as writer:
+            updated, current = reproject_catalog(supabase, projection, writer)
+        print(f"Wrote gen_vector (projection v{projection.version}) for {updated} videos, "
+              f"{current} were already current")
@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision.transforms import CenterCrop, Compose, InterpolationMode, Normalize, Resize, ToTensor
+
+MODEL_NAME = "ViT-B/32"
+CACHE_DIR = "models"
+INPUT_SIZE = 224
+
+# CLIP's own normalization constants
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+
+def clip_preprocess(n_px=INPUT_SIZE):
+    """Same transform clip.load returns, so the cached encoder can start without loading CLIP."""
+    return Compose([
+        Resize(n_px, interpolation=InterpolationMode.BICUBIC),
+        CenterCrop(n_px),
+        lambda image: image.convert("RGB"),
+        ToTensor(),
+        Normalize(CLIP_MEAN, CLIP_STD),
+    ])
+
+
+class QuantizedEncoder:
+    """
+    Minimal stand-in for a CLIP model exposing encode_image, backed by an
+    int8 dynamically quantized visual tower. CPU only.
+    """
+
+    def __init__(self, visual):
+        self.visual = visual
+
+    def encode_image(self, images):
+        return self.visual(images.float())
+
+    def eval(self):
+        self.visual.eval()
+        return self
+
+
+def quantize_visual(model):
+    """Dynamic int8 quantization of every nn.Linear in the visual encoder (weights int8, activations quantized on the fly)."""
+    visual = model.visual.float().eval()
+    return torch.ao.quantization.quantize_dynamic(visual, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def cache_path(model_name=MODEL_NAME, cache_dir=CACHE_DIR):
+    # traced modules are tied to the torch version that produced them
+    name = model_name.replace("/", "_")
+    return os.path.join(cache_dir, f"clip_{name}_visual_int8_torch{torch.__version__.split('+')[0]}.pt")
+
+
+def load_fast_encoder(model_name=MODEL_NAME, cache_dir=CACHE_DIR):
+    """
+    Return (encoder, preprocess) for the quantized fast-embedding mode.
+
+    The first call loads fp32 CLIP, quantizes the visual encoder, traces it
+    and saves the TorchScript module; later calls just torch.jit.load it.
+    """
+    path = cache_path(model_name, cache_dir)
+    if os.path.exists(path):
+        visual = torch.jit.load(path, map_location="cpu")
+        return QuantizedEncoder(visual).eval(), clip_preprocess()
+
+    import clip
+    model, preprocess = clip.load(model_name, device="cpu")
+    quantized = quantize_visual(model)
+    example = torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE)
+    with torch.inference_mode():
+        traced = torch.jit.trace(quantized, example, check_trace=False)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = path + ".tmp"
+    torch.jit.save(traced, tmp)
+    os.replace(tmp, path)
+    print(f"Cached quantized CLIP visual encoder at {path}")
+    return QuantizedEncoder(traced).eval(), preprocess
+
+
+def benchmark(reference, fast, preprocess, frames, batch_size=32, repeats=3):
+    """
+    Frames/sec for both encoders on the same frames, and cosine agreement
+    between their normalized embeddings.
+    """
+    images = torch.stack([preprocess(Image.fromarray(f)) for f in frames])
+
+    def run(model):
+        outputs, best = None, float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            with torch.inference_mode():
+                outputs = torch.cat([model.encode_image(images[i:i + batch_size]).float()
+                                     for i in range(0, len(images), batch_size)])
+            best = min(best, time.perf_counter() - start)
+        return torch.nn.functional.normalize(outputs, dim=-1).numpy(), len(images) / best
+
+    ref_emb, ref_fps = run(reference)
+    fast_emb, fast_fps = run(fast)
+    cosine = (ref_emb * fast_emb).sum(axis=1)
+    return {
+        "frames": len(images),
+        "fp32_frames_per_sec": ref_fps,
+        "int8_frames_per_sec": fast_fps,
+        "speedup": fast_fps / ref_fps,
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+    }
+
+
+if __name__ == "__main__":
+    # python quantized.py [video ...]  -> fp32 vs int8 throughput and agreement
+    import json
+    import clip
+    from frames import sample_frames
+
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) - 1))
+    if len(sys.argv) > 1:
+        frames = [f for path in sys.argv[1:] for f in sample_frames(path, fps=2, duration=5)]
+    else:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (INPUT_SIZE, INPUT_SIZE, 3), dtype=np.uint8) for _ in range(64)]
+
+    model, preprocess = clip.load(MODEL_NAME, device="cpu")
+    model.eval()
+    fast, _ = load_fast_encoder()
+    print(json.dumps(benchmark(model, fast, preprocess, frames), indent=2))
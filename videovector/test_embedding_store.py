@@ -0,0 +1,46 @@
+import numpy as np
+
+from embedding_store import EmbeddingStore, VectorTable
+
+
+def test_append_after_interrupted_append(tmp_path):
+    table = VectorTable(str(tmp_path), dim=4)
+    table.append([("a",)], [[1, 1, 1, 1]])
+    # a crash between writing vectors.f32 and keys.tsv leaves an orphan row
+    with open(table._vectors_path, "ab") as f:
+        np.full(4, 9, np.float32).tofile(f)
+
+    table = VectorTable(str(tmp_path))
+    assert len(table) == 1
+    table.append([("b",)], [[2, 2, 2, 2]])
+
+    table = VectorTable(str(tmp_path))
+    matrix = table.matrix()
+    assert table.rows_for([("a",), ("b",)]) == [0, 1]
+    np.testing.assert_array_equal(matrix[1], [2, 2, 2, 2])
+    assert matrix.shape == (2, 4)
+
+
+def test_keys_without_vectors_are_dropped(tmp_path):
+    table = VectorTable(str(tmp_path), dim=2)
+    table.append([("a",)], [[1, 1]])
+    with open(table._keys_path, "a") as f:
+        f.write("ghost\n")
+
+    table = VectorTable(str(tmp_path))
+    table.append([("b",)], [[2, 2]])
+    table = VectorTable(str(tmp_path))
+    assert table.keys == [("a",), ("b",)]
+    np.testing.assert_array_equal(table.matrix()[table.index[("b",)]], [2, 2])
+
+
+def test_video_matrix_keeps_latest_rows_without_copying(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=2)
+    store.add_video("h1", "animals", [1, 1])
+    store.add_video("h2", "nature", [2, 2])
+    store.add_video("h1", "animals", [3, 3])
+
+    hashes, categories, vectors, rows = store.video_matrix()
+    assert isinstance(vectors, np.memmap)
+    assert hashes == ["h2", "h1"] and categories == ["nature", "animals"]
+    np.testing.assert_array_equal(vectors[rows], [[2, 2], [3, 3]])
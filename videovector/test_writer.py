@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from writer import BulkWriter, LocalStorage, LocalTable
+
+
+def test_bulk_writer_end_to_end(tmp_path):
+    for i in range(5):
+        (tmp_path / f"clip_{i}.mp4").write_bytes(b"video %d" % i)
+    hls = tmp_path / "hls"
+    (hls / "360w").mkdir(parents=True)
+    (hls / "master.m3u8").write_text("#EXTM3U\n")
+    (hls / "360w" / "index.m3u8").write_text("#EXTM3U\n")
+
+    storage = LocalStorage(str(tmp_path / "bucket"), base_url="http://cdn")
+    table = LocalTable(str(tmp_path / "videos.jsonl"))
+    committed = []
+    with BulkWriter(storage, table, batch_size=2, max_uploads=2) as writer:
+        for i in range(5):
+            writer.upload(str(tmp_path / f"clip_{i}.mp4"), then=lambda url, error, i=i: writer.write(
+                {"id": i, "url": url}, on_commit=lambda i=i: committed.append(i)))
+        ladder = writer.upload_dir(str(hls), "abc")
+
+    assert sorted(r["id"] for r in table.rows) == list(range(5))
+    assert all(r["url"] == f"http://cdn/clip_{r['id']}.mp4" for r in table.rows)
+    assert sorted(committed) == list(range(5))
+    assert table.requests == 3  # two full batches and the remainder
+    assert (tmp_path / "bucket" / "clip_3.mp4").read_bytes() == b"video 3"
+    assert sorted(f.result() for f in ladder) == ["http://cdn/abc/360w/index.m3u8", "http://cdn/abc/master.m3u8"]
+    with open(tmp_path / "videos.jsonl") as f:
+        assert len([json.loads(line) for line in f]) == 5
+
+
+def test_callback_failures_surface_on_drain(tmp_path):
+    (tmp_path / "clip.mp4").write_bytes(b"video")
+    table = LocalTable()
+    writer = BulkWriter(LocalStorage(str(tmp_path / "bucket")), table, batch_size=1, retries=1)
+
+    def broken_commit():
+        raise ValueError("manifest unavailable")
+
+    writer.upload(str(tmp_path / "clip.mp4"), then=lambda url, error: writer.write({"url": url}, broken_commit))
+    writer.upload(str(tmp_path / "missing.mp4"))
+    with pytest.raises(RuntimeError, match="2 background writes failed"):
+        writer.drain()
+    assert len(writer.errors) == 2
+    writer.close()  # already reported, nothing new to raise
+
+
+def test_body_exception_wins_over_drain_failure(tmp_path):
+    writer = BulkWriter(LocalStorage(str(tmp_path / "bucket")), LocalTable(), retries=1)
+    with pytest.raises(KeyError):
+        with writer:
+            writer.upload(str(tmp_path / "missing.mp4"))
+            raise KeyError("ingest failed")
+    assert writer.pool._shutdown
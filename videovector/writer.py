@@ -0,0 +1,280 @@
+import json
+import mimetypes
+import os
+import random
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+BATCH_SIZE = 200     # rows per insert/upsert request
+MAX_UPLOADS = 8      # concurrent storage uploads (bounded connection pool)
+RETRIES = 5
+BACKOFF = 0.5        # seconds, doubled per attempt with jitter
+MAX_BACKOFF = 10
+
+# HLS types are missing from some platforms' mimetypes tables
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+
+def with_retry(fn, *args, retries=RETRIES, backoff=BACKOFF, **kwargs):
+    """Call fn, retrying with exponential backoff and jitter on any exception."""
+    for attempt in range(retries):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            delay = min(MAX_BACKOFF, backoff * 2 ** attempt) * (0.5 + random.random() / 2)
+            print(f"⚠️ {getattr(fn, '__name__', 'call')} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+# -----------------------------
+# Backends
+# -----------------------------
+class SupabaseStorage:
+    def __init__(self, client, bucket="videos", cache_control="3600"):
+        self.bucket = client.storage.from_(bucket)
+        self.cache_control = cache_control
+
+    def upload(self, file_path, name):
+        # upsert overwrites in one request instead of remove + upload
+        options = {"cacheControl": self.cache_control, "upsert": "true"}
+        content_type = mimetypes.guess_type(name)[0]
+        if content_type:
+            options["content-type"] = content_type
+        with open(file_path, "rb") as f:
+            self.bucket.upload(name, f, options)
+        return self.bucket.get_public_url(name)
+
+
+class SupabaseTable:
+    def __init__(self, client, name="videos"):
+        self.client = client
+        self.name = name
+
+    def insert(self, rows):
+        self.client.table(self.name).insert(rows).execute()
+
+    def upsert(self, rows, on_conflict):
+        self.client.table(self.name).upsert(rows, on_conflict=on_conflict).execute()
+
+
+class LocalStorage:
+    """Stand-in for Supabase storage: copies files into a directory."""
+
+    def __init__(self, root="local_storage", base_url=None):
+        self.root = root
+        self.base_url = base_url or f"file://{os.path.abspath(root)}"
+        os.makedirs(root, exist_ok=True)
+
+    def upload(self, file_path, name):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(file_path, path)
+        return f"{self.base_url}/{name}"
+
+
+class LocalTable:
+    """Stand-in for a Supabase table: rows kept in memory and optionally appended to a JSON-lines file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.rows = []
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def _write(self, rows):
+        if self.path:
+            with open(self.path, "a") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+
+    def insert(self, rows):
+        with self.lock:
+            self.requests += 1
+            self.rows.extend(rows)
+            self._write(rows)
+
+    def upsert(self, rows, on_conflict):
+        with self.lock:
+            self.requests += 1
+            index = {r[on_conflict]: i for i, r in enumerate(self.rows)}
+            for row in rows:
+                if row[on_conflict] in index:
+                    self.rows[index[row[on_conflict]]] = row
+                else:
+                    index[row[on_conflict]] = len(self.rows)
+                    self.rows.append(row)
+            self._write(rows)
+
+
+# -----------------------------
+# Bulk writer
+# -----------------------------
+class BulkWriter:
+    """
+    Concurrent uploads plus buffered, batched table writes.
+
+    upload() runs on a bounded thread pool and returns a Future for the
+    public URL; its optional then(url, error) callback runs on the upload
+    thread before the future completes, so rows it writes are always seen
+    by close(). upload_dir() does the same for a whole directory (an HLS
+    ladder) under one name prefix. write() buffers rows and flushes them in one insert (or
+    upsert when on_conflict is set) per batch_size rows; each row's
+    on_commit callback runs once its batch is stored. prepare(rows), if
+    given, transforms each batch right before it is written. Use as a context
+    manager or call drain()/close() to wait for uploads and flush the remainder.
+
+    Failures on upload threads that nobody handled (an upload without a
+    callback, or a callback that raised, e.g. a batch store or on_commit
+    called from it) are kept in `errors`, and the next drain() raises once
+    for them after flushing.
+    """
+
+    def __init__(self, storage, table, batch_size=BATCH_SIZE, max_uploads=MAX_UPLOADS,
+                 on_conflict=None, retries=RETRIES, backoff=BACKOFF, prepare=None):
+        self.storage = storage
+        self.table = table
+        self.prepare = prepare
+        self.batch_size = batch_size
+        self.on_conflict = on_conflict
+        self.retries = retries
+        self.backoff = backoff
+        self.pool = ThreadPoolExecutor(max_workers=max_uploads)
+        self.slots = threading.BoundedSemaphore(max_uploads * 4)  # cap queued uploads
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.uploads = []
+        self.errors = []  # (upload name, exception) from upload threads
+        self.raised = 0   # errors already raised by drain()
+
+    def _failed(self, name, error):
+        print(f"⚠️ Background write for {name} failed: {error!r}")
+        with self.lock:
+            self.errors.append((name, error))
+
+    def _callback(self, then, name, url, error):
+        try:
+            then(url, error)
+        except Exception as e:
+            self._failed(name, e)
+            raise
+
+    def upload(self, file_path, name=None, then=None):
+        name = name or os.path.basename(file_path)
+        self.slots.acquire()
+
+        def run():
+            try:
+                url = with_retry(self.storage.upload, file_path, name, retries=self.retries, backoff=self.backoff)
+            except Exception as e:
+                if then:
+                    self._callback(then, name, None, e)
+                else:
+                    self._failed(name, e)
+                raise
+            finally:
+                self.slots.release()
+            if then:
+                self._callback(then, name, url, None)
+            return url
+
+        future = self.pool.submit(run)
+        with self.lock:
+            self.uploads.append(future)
+        return future
+
+    def upload_dir(self, directory, prefix, then=None):
+        """
+        Upload every file under `directory` as prefix/relative_path.
+        then({relative_path: url}, error) runs once, after the last upload
+        finished or the first one failed for good.
+        """
+        files = sorted(os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/")
+                       for root, _, names in os.walk(directory) for name in names)
+        urls, state = {}, {"pending": len(files), "failed": False}
+        lock = threading.Lock()
+
+        def done(rel):
+            def callback(url, error):
+                with lock:
+                    if state["failed"]:
+                        return
+                    if error:
+                        state["failed"] = True
+                    else:
+                        urls[rel] = url
+                        state["pending"] -= 1
+                        if state["pending"]:
+                            return
+                if then:
+                    then(None if error else urls, error)
+            return callback
+
+        if not files and then:
+            then({}, None)
+        return [self.upload(os.path.join(directory, rel), f"{prefix}/{rel}", then=done(rel)) for rel in files]
+
+    def write(self, row, on_commit=None):
+        with self.lock:
+            self.buffer.append((row, on_commit))
+            if len(self.buffer) < self.batch_size:
+                return
+            batch, self.buffer = self.buffer, []
+        self._store(batch)
+
+    def flush(self):
+        with self.lock:
+            batch, self.buffer = self.buffer, []
+        if batch:
+            self._store(batch)
+
+    def _store(self, batch):
+        rows = [row for row, _ in batch]
+        if self.prepare:
+            rows = self.prepare(rows)
+        if self.on_conflict:
+            with_retry(self.table.upsert, rows, self.on_conflict, retries=self.retries, backoff=self.backoff)
+        else:
+            with_retry(self.table.insert, rows, retries=self.retries, backoff=self.backoff)
+        for _, on_commit in batch:
+            if on_commit:
+                on_commit()
+
+    def drain(self):
+        """Wait for all uploads, then flush buffered rows; raises if background writes failed since the last drain."""
+        # upload callbacks may write rows, so drain uploads before the last flush
+        while True:
+            with self.lock:
+                pending, self.uploads = self.uploads, []
+            if not pending:
+                break
+            wait(pending)
+        self.flush()
+        with self.lock:
+            failed, self.raised = self.errors[self.raised:], len(self.errors)
+        if failed:
+            name, error = failed[0]
+            raise RuntimeError(f"{len(failed)} background writes failed, first {name}: {error!r}") from error
+
+    def close(self):
+        try:
+            self.drain()
+        finally:
+            self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+            return
+        # the body already failed: still drain, but keep its exception the one that propagates
+        try:
+            self.close()
+        except Exception as e:
+            print(f"⚠️ Closing the writer after {exc_type.__name__} also failed: {e!r}")